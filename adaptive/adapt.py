@@ -4,9 +4,33 @@
 # Harri Salokorpi, 2004
 #------------------------------------------------------------------------------
 
+import os
+import sys
 import math
-import wave
-import array
+
+# Shared modules
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                    "common"))
+import wavio
+
+# Radix-2 FFT for the frequency-domain filter
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                    "radix2-fft"))
+import fft
+
+# NumPy is needed only by the block generators and vectorized filters
+try:
+    import numpy
+    from numpy.lib.stride_tricks import as_strided
+except ImportError:
+    numpy = None
+
+try:
+    import scipy.linalg.lapack
+except ImportError:
+    scipy = None
 
 #------------------------------------------------------------------------------
 # Class definitions
@@ -76,6 +100,7 @@ class IIRSineGenerator:
 
         # Create IIR filter that generates sine
         w = 2 * math.pi * freq_ / samplerate_
+        self.w = w
         a1 = 2 * math.cos(w)
         a2 = -1
         b0 = 0
@@ -88,6 +113,29 @@ class IIRSineGenerator:
     def generate(self):
         return self.iir.filter(0.125) - 0.38
 
+    # Generate block of count samples (NumPy array) in closed form. With
+    # constant input the state is w[k] = c + u[k], where c is the DC
+    # solution and u[k] = 2cos(w) u[k-1] - u[k-2] is a sinusoid set by the
+    # two previous states.
+    def generate_block(self, count):
+        iir = self.iir
+        sinw = math.sin(self.w)
+        if abs(sinw) < 1e-9:
+            return numpy.array([self.generate() for i in range(count)])
+
+        c = 0.125 / (1.0 - iir.a1 - iir.a2)
+        u1, u2 = iir.buf[1] - c, iir.buf[2] - c
+
+        # States w[-2] .. w[count-1]
+        k = numpy.arange(-2, count)
+        w = c + (u1 * numpy.sin((k + 2) * self.w) -
+                 u2 * numpy.sin((k + 1) * self.w)) / sinw
+        w[0], w[1] = iir.buf[2], iir.buf[1]
+
+        out = iir.b0 * w[2:] + iir.b1 * w[1:-1] + iir.b2 * w[:-2]
+        iir.buf[0], iir.buf[1], iir.buf[2] = w[-1], w[-1], w[-2]
+        return out - 0.38
+
 
 # Sine generator
 class SineGenerator:
@@ -108,6 +156,15 @@ class SineGenerator:
         sample = math.sin(self.angle)
         return sample
 
+    # Generate block of count samples (NumPy array) continuing the phase of
+    # generate. The angle is kept wrapped to [0, 2pi).
+    def generate_block(self, freq, count):
+        anglechange = 2.0 * math.pi * (
+            float(freq.freq) / float(self.samplerate))
+        angles = self.angle + anglechange * numpy.arange(1, count + 1)
+        self.angle = math.fmod(self.angle + anglechange * count, 2.0 * math.pi)
+        return numpy.sin(angles)
+
 
 # Adaptive filter class
 class AdaptiveFilter:
@@ -152,6 +209,330 @@ class AdaptiveFilter:
         return outbuf
 
 
+# Vectorized adaptive filter. Mode "lms" has the same adaptation as
+# AdaptiveFilter (coeffs are updated after every sample), "nlms" divides
+# the step roc by the energy of the history window and "rls" is
+# recursive least squares. Taps can differ from blocksize.
+#
+# LMS and NLMS process the block in sub-blocks of L samples. With history
+# rows x[i], steps u[i] and coeffs w at the start of the sub-block, coeffs
+# before sample i are w + sum(u[k] e[k] x[k], k < i), so the errors solve
+#
+#	(I + tril(X X', -1) diag(u)) e = d - X w
+#
+# and the coeffs after the sub-block are w + X' (u e). This gives the
+# sample-by-sample result with matrix products and a triangular solve.
+# Window energies come from a running sum of squares over the history.
+#
+# RLS updates the inverse correlation matrix P sample by sample, O(taps^2)
+# vectorized operations per sample. Narrowband noise excites only a few
+# directions of P, and the forgetting factor grows it as forget^-n in all
+# the others until rounding makes it asymmetric and indefinite. So P is
+# kept symmetric, and scaled down whenever its trace grows past the initial
+# trace taps / delta.
+class VectorAdaptiveFilter:
+    # Constructor (taps defaults to blocksize like in AdaptiveFilter)
+    def __init__(self, blocksize, roc, taps=None, mode="lms"):
+        if numpy is None:
+            raise ImportError("VectorAdaptiveFilter requires numpy")
+        if mode not in adaptive_modes:
+            raise ValueError("Unknown mode: %s" % mode)
+        if taps == None:
+            taps = blocksize
+        self.blocksize = blocksize
+        self.roc = roc
+        self.taps = taps
+        self.mode = mode
+        self.coeffs = numpy.zeros(taps)
+        self.nbuf = numpy.zeros(taps - 1 + blocksize)
+        self.x = self.windows()
+        if mode == "rls":
+            self.inverse = numpy.eye(taps) / rls_delta
+        return
+
+    # History windows of the block, row i holds noise[i - j] in column j.
+    # The view of nbuf is built once as self.x.
+    def windows(self):
+        stride = self.nbuf.strides[0]
+        view = as_strided(self.nbuf,
+                          shape=(self.blocksize, self.taps),
+                          strides=(stride, stride))
+        return view[:, ::-1]
+
+    # Step sizes of the block samples
+    def steps(self):
+        if self.mode == "lms":
+            return numpy.ones(self.blocksize) * (2 * self.roc)
+
+        # Window energies as differences of a running sum of squares
+        total = numpy.zeros(len(self.nbuf) + 1)
+        numpy.cumsum(self.nbuf**2, out=total[1:])
+        energy = total[self.taps:] - total[:self.blocksize]
+        return self.roc / (nlms_delta + numpy.maximum(energy, 0.0))
+
+    # Filter noise from signal with noise (swn), returns numpy array
+    def filter(self, swn, noise):
+        swn = numpy.asarray(swn, dtype=numpy.float64)
+        noise = numpy.asarray(noise, dtype=numpy.float64)
+        if swn.shape != (self.blocksize, ) or noise.shape != swn.shape:
+            raise ValueError("Invalid incoming data blocksize")
+
+        # Keep taps - 1 samples of history before the new block
+        self.nbuf[:self.taps - 1] = self.nbuf[self.blocksize:].copy()
+        self.nbuf[self.taps - 1:] = noise
+
+        if self.mode == "rls":
+            return self.filter_rls(swn, self.x)
+
+        # Contiguous rows keep the matrix products in BLAS
+        x = numpy.ascontiguousarray(self.x)
+        out = numpy.empty(self.blocksize)
+        steps = self.steps()
+
+        for start in range(0, self.blocksize, lms_blocklen):
+            xs = x[start:start + lms_blocklen]
+            u = steps[start:start + lms_blocklen]
+            d = swn[start:start + lms_blocklen] - xs.dot(self.coeffs)
+            e = lower_solve(xs.dot(xs.T) * u, d)
+
+            out[start:start + lms_blocklen] = e
+            self.coeffs += (u * e).dot(xs)
+
+        return out
+
+    # RLS over history windows x, returns errors
+    def filter_rls(self, swn, x):
+        out = numpy.empty(self.blocksize)
+        coeffs, inverse = self.coeffs, self.inverse
+        limit = self.taps / rls_delta
+
+        for i in range(self.blocksize):
+            px = inverse.dot(x[i])
+            gain = px / (rls_forget + x[i].dot(px))
+            e = swn[i] - coeffs.dot(x[i])
+            coeffs += gain * e
+            inverse -= numpy.outer(gain, px)
+            inverse[:] = (inverse + inverse.T) * (0.5 / rls_forget)
+            trace = numpy.trace(inverse)
+            if trace > limit:
+                inverse *= limit / trace
+            out[i] = e
+
+        return out
+
+
+# Multichannel canceller, adapts channels primaries against references
+# noise references with (channels, references, taps) coeffs. Adaptation
+# is the same as in VectorAdaptiveFilter with the reference windows of a
+# sample stacked into one regressor. The regressor, its Gram matrix, NLMS
+# steps and RLS gains depend on the references only, so they are built
+# once per block and shared by all channels; the LMS/NLMS triangular solve
+# has one right-hand side per channel.
+class MultiChannelAdaptiveFilter:
+    # Constructor (taps defaults to blocksize)
+    def __init__(self,
+                 blocksize,
+                 roc,
+                 channels,
+                 references=1,
+                 taps=None,
+                 mode="lms"):
+        if numpy is None:
+            raise ImportError("MultiChannelAdaptiveFilter requires numpy")
+        if mode not in adaptive_modes:
+            raise ValueError("Unknown mode: %s" % mode)
+        if taps == None:
+            taps = blocksize
+        self.blocksize = blocksize
+        self.roc = roc
+        self.channels = channels
+        self.references = references
+        self.taps = taps
+        self.mode = mode
+        self.coeffs = numpy.zeros((channels, references, taps))
+        self.nbuf = numpy.zeros((references, taps - 1 + blocksize))
+        if mode == "rls":
+            self.inverse = numpy.eye(references * taps) / rls_delta
+        return
+
+    # Regressors of the block, (blocksize, references * taps) where row i
+    # holds noise[r, i - j] in column r * taps + j
+    def windows(self):
+        rstride, stride = self.nbuf.strides
+        view = as_strided(self.nbuf,
+                          shape=(self.blocksize, self.references, self.taps),
+                          strides=(stride, rstride, stride))
+        return view[:, :, ::-1].reshape(self.blocksize, -1)
+
+    # Step sizes of the block samples
+    def steps(self):
+        if self.mode == "lms":
+            return numpy.ones(self.blocksize) * (2 * self.roc)
+
+        # Regressor energies as differences of running sums of squares
+        total = numpy.zeros((self.references, self.nbuf.shape[1] + 1))
+        numpy.cumsum(self.nbuf**2, axis=1, out=total[:, 1:])
+        energy = (total[:, self.taps:] - total[:, :self.blocksize]).sum(0)
+        return self.roc / (nlms_delta + numpy.maximum(energy, 0.0))
+
+    # Filter noise from (channels, blocksize) signals with noise (swn)
+    # using (references, blocksize) noise, returns errors like swn
+    def filter(self, swn, noise):
+        swn = numpy.asarray(swn, dtype=numpy.float64)
+        noise = numpy.asarray(noise, dtype=numpy.float64)
+        if swn.shape != (self.channels, self.blocksize) or \
+         noise.shape != (self.references, self.blocksize):
+            raise ValueError("Invalid incoming data blocksize")
+
+        # Keep taps - 1 samples of history before the new block
+        self.nbuf[:, :self.taps - 1] = self.nbuf[:, self.blocksize:].copy()
+        self.nbuf[:, self.taps - 1:] = noise
+
+        x = numpy.ascontiguousarray(self.windows())
+        coeffs = self.coeffs.reshape(self.channels, -1)
+        out = numpy.empty((self.channels, self.blocksize))
+
+        if self.mode == "rls":
+            inverse = self.inverse
+            limit = len(inverse) / rls_delta
+            for i in range(self.blocksize):
+                px = inverse.dot(x[i])
+                gain = px / (rls_forget + x[i].dot(px))
+                e = swn[:, i] - coeffs.dot(x[i])
+                coeffs += numpy.outer(e, gain)
+                inverse -= numpy.outer(gain, px)
+                inverse[:] = (inverse + inverse.T) * (0.5 / rls_forget)
+                trace = numpy.trace(inverse)
+                if trace > limit:
+                    inverse *= limit / trace
+                out[:, i] = e
+            return out
+
+        steps = self.steps()
+        for start in range(0, self.blocksize, lms_blocklen):
+            xs = x[start:start + lms_blocklen]
+            u = steps[start:start + lms_blocklen]
+            d = swn[:, start:start + lms_blocklen].T - xs.dot(coeffs.T)
+            e = lower_solve(xs.dot(xs.T) * u, d)
+
+            out[:, start:start + lms_blocklen] = e.T
+            coeffs += (u[:, numpy.newaxis] * e).T.dot(xs)
+
+        return out
+
+
+# Frequency-domain block LMS (overlap-save FDAF). The noise history of
+# N >= blocksize + taps - 1 samples is transformed once per block. Output
+# is the last blocksize samples of IFFT(X W), and the gradient is the
+# first taps lags of IFFT(conj(X) E / P), where E is the transform of the
+# zero padded error block and P a running power estimate of every bin.
+# Each block costs five real FFTs of size N.
+#
+# P is floored by a fraction of its mean over the bins. Without the floor,
+# bins where the primary has signal but the reference has next to no power
+# (a tone or DC offset of the signal) get huge steps and the filter
+# diverges.
+class FrequencyDomainAdaptiveFilter:
+    # Constructor (taps defaults to blocksize, roc is the normalized step)
+    def __init__(self, blocksize, roc, taps=None, engine="numpy"):
+        if numpy is None:
+            raise ImportError("FrequencyDomainAdaptiveFilter requires numpy")
+        if taps == None:
+            taps = blocksize
+        self.blocksize = blocksize
+        self.roc = roc
+        self.taps = taps
+
+        size = 2
+        while size < blocksize + taps - 1:
+            size <<= 1
+        self.size = size
+        self.plan = fft.rfft_plan(size, engine)
+
+        self.coeffs = numpy.zeros(size // 2 + 1, dtype=numpy.complex128)
+        self.power = numpy.zeros(size // 2 + 1)
+        self.primed = False
+        self.nbuf = numpy.zeros(size)
+        self.ebuf = numpy.zeros(size)
+        return
+
+    # Time-domain coefficients (taps)
+    def weights(self):
+        return numpy.asarray(self.plan.execute_inverse(
+            None, self.coeffs))[:self.taps]
+
+    # Filter noise from signal with noise (swn), returns numpy array
+    def filter(self, swn, noise):
+        swn = numpy.asarray(swn, dtype=numpy.float64)
+        noise = numpy.asarray(noise, dtype=numpy.float64)
+        if swn.shape != (self.blocksize, ) or noise.shape != swn.shape:
+            raise ValueError("Invalid incoming data blocksize")
+
+        size, count = self.size, self.blocksize
+
+        # Slide noise history by one block
+        self.nbuf[:size - count] = self.nbuf[count:].copy()
+        self.nbuf[size - count:] = noise
+        x = numpy.asarray(self.plan.execute(None, self.nbuf))
+
+        # Filter output and error
+        y = numpy.asarray(self.plan.execute_inverse(None, x * self.coeffs))
+        e = swn - y[size - count:]
+
+        # Per bin step normalization, first block starts the estimates
+        if self.primed:
+            self.power *= fdaf_forget
+            self.power += (1.0 - fdaf_forget) * (x.real**2 + x.imag**2)
+        else:
+            self.power[:] = x.real**2 + x.imag**2
+            self.primed = True
+
+        # Constrained gradient (taps lags only)
+        self.ebuf[size - count:] = e
+        spectrum = numpy.asarray(self.plan.execute(None, self.ebuf))
+        floor = fdaf_delta + fdaf_floor * self.power.mean()
+        spectrum *= x.conj() / (self.power + floor)
+        gradient = numpy.asarray(self.plan.execute_inverse(None, spectrum))
+        gradient[self.taps:] = 0.0
+
+        self.coeffs += self.roc * numpy.asarray(
+            self.plan.execute(None, gradient))
+        return e
+
+
+#------------------------------------------------------------------------------
+# Block LMS triangular solve
+#
+# The matrix of the sub-block errors is unit lower triangular, so only its
+# strictly lower triangle is read and the diagonal is taken as ones. With
+# SciPy the system goes to LAPACK trtrs, the routine behind
+# scipy.linalg.solve_triangular(a, b, lower=True, unit_diagonal=True)
+# without its argument checks, which cost more than the solve itself at
+# 32 taps. The NumPy fallback is forward substitution over the rows.
+#------------------------------------------------------------------------------
+
+
+# Solve a x = b with SciPy, b is (n) or (n, right-hand sides)
+def lower_solve_scipy(a, b):
+    x, info = scipy.linalg.lapack.dtrtrs(a, b, lower=1, unitdiag=1)
+    return x
+
+
+# Solve a x = b with NumPy forward substitution
+def lower_solve_numpy(a, b):
+    x = numpy.array(b, dtype=numpy.float64)
+    for i in range(1, len(x)):
+        x[i] -= a[i, :i].dot(x[:i])
+    return x
+
+
+# Solve a x = b with SciPy when available
+def lower_solve(a, b):
+    if scipy is not None:
+        return lower_solve_scipy(a, b)
+    return lower_solve_numpy(a, b)
+
+
 #------------------------------------------------------------------------------
 # Data tables and general settings
 #------------------------------------------------------------------------------
@@ -178,25 +559,166 @@ freqtable = map(Freq, range(100, 8000, 100))
 sinegen = SineGenerator(samplerate)
 iirsinegen = IIRSineGenerator(samplerate)
 
+# Adaptation modes of VectorAdaptiveFilter
+adaptive_modes = ["lms", "nlms", "rls"]
+
+# Sub-block length of VectorAdaptiveFilter (bounds the triangular solve)
+lms_blocklen = 64
+
+# Regularization of the NLMS step normalization
+nlms_delta = 1e-6
+
+# RLS forgetting factor and initial inverse correlation (I / delta)
+rls_forget = 0.999
+rls_delta = 0.01
+
+# Forgetting factor of the FDAF bin power estimates
+fdaf_forget = 0.9
+
+# Regularization of the FDAF step normalization, the floor of the bin
+# powers is fdaf_delta + fdaf_floor * mean bin power
+fdaf_delta = 1e-6
+fdaf_floor = 1.0
+
+# Default FDAF step (normalized, stable up to 1 with the power floor)
+fdaf_roc = 0.1
+
 # Adaptive filter
 af = AdaptiveFilter(blocksize, roc)
 
+# Adaptive filter engines by name (adaptive_modes select the mode of
+# VectorAdaptiveFilter)
+engines = {
+    "list": AdaptiveFilter,
+    "numpy": VectorAdaptiveFilter,
+    "fdaf": FrequencyDomainAdaptiveFilter
+}
+
+# Residual level above the final one that still counts as converging
+convergence_margin = 3.0
+
 #------------------------------------------------------------------------------
 # Main functions
 #------------------------------------------------------------------------------
 
 
-# Main function
+# Create adaptive filter by engine or mode name
+def make_filter(engine, blocksize_, roc_):
+    if engine in adaptive_modes:
+        return VectorAdaptiveFilter(blocksize_, roc_, None, engine)
+    return engines[engine](blocksize_, roc_)
+
+
+# Run filt through count samples of every test frequency in turn, like
+# main does, and return residual noise power in dB per window of samples
+# as (frequencies, windows) array
+def convergence_curve(filt, freqs, count=scount, window=None):
+    if window == None:
+        window = filt.blocksize
+    count = count // filt.blocksize * filt.blocksize
+    sgen = IIRSineGenerator(samplerate)
+    ngen = SineGenerator(samplerate)
+
+    curve = []
+    for freq in freqs:
+        signal = sgen.generate_block(count) / 2.0
+        noise = ngen.generate_block(freq, count) / 2.0
+        swn = noise + signal
+
+        out = numpy.concatenate([
+            filt.filter(swn[i:i + filt.blocksize], noise[i:i + filt.blocksize])
+            for i in range(0, count, filt.blocksize)
+        ])
+
+        # Whatever is left besides the signal is residual noise
+        residual = (out - signal)[:count // window * window]
+        power = (residual.reshape(-1, window)**2).mean(axis=1)
+        curve.append(10 * numpy.log10(numpy.maximum(power, 1e-30)))
+
+    return numpy.array(curve)
+
+
+# Samples until a curve row stays within margin dB of its final level (the
+# median of the last quarter)
+def convergence_time(row, window, margin=convergence_margin):
+    final = numpy.median(row[-max(len(row) // 4, 1):])
+    above = numpy.nonzero(row > final + margin)[0]
+    if not len(above):
+        return 0
+    return (above[-1] + 1) * window
+
+
+# Print convergence time and final residual of every test frequency
+def print_convergence(filt, name):
+    curve = convergence_curve(filt, freqtable)
+    print("-----------------------------------------------------------------")
+    print("    Convergence (%s)" % name)
+    print("-----------------------------------------------------------------")
+    for freq, row in zip(freqtable, curve):
+        print("Freq: %4d, Converged: %5d samples, Residual: %6.1f dB" %
+              (freq.freq, convergence_time(row, filt.blocksize),
+               numpy.median(row[-max(len(row) // 4, 1):])))
+    return
+
+
+# Get value of command line option, default if not given
+def option(name, default):
+    if name in sys.argv[1:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+# Cancel noise from stereo WAV file, channel 0 is signal with noise and
+# channel 1 the noise reference
+def cancel_wav(infile, outfile, filt=None):
+    if filt == None:
+        filt = af
+    source = wavio.WavSource(infile)
+    if source.channels != 2:
+        raise ValueError("Input must be a stereo file")
+    waveout = wavio.WavSink(outfile, source.samplerate)
+
+    # Last block is padded with zeros up to the block size of the filter
+    size = filt.blocksize
+    swn, noise = [0.0] * size, [0.0] * size
+    for block in source.int_blocks(size):
+        count = len(block)
+        swn[:count] = (block[:, 0] * (1.0 / 2**(bits - 1))).tolist()
+        noise[:count] = (block[:, 1] * (1.0 / 2**(bits - 1))).tolist()
+        swn[count:] = noise[count:] = [0.0] * (size - count)
+
+        out = filt.filter(swn, noise)
+        waveout.write(out[:count])
+
+    waveout.close()
+    return
+
+
+# Main function (--cancel <in> <out> filters a WAV file, --curve prints
+# convergence times, --engine <name> and --roc <value> select the filter)
 def main():
 
+    filt = af
+    engine = option("--engine", "list")
+    if "--engine" in sys.argv[1:-1] or "--roc" in sys.argv[1:-1]:
+        default = roc
+        if engine == "fdaf":
+            default = fdaf_roc
+        filt = make_filter(engine, blocksize, float(option("--roc", default)))
+
+    if "--cancel" in sys.argv[1:-2]:
+        pos = sys.argv.index("--cancel")
+        cancel_wav(sys.argv[pos + 1], sys.argv[pos + 2], filt)
+        print("Wrote file %s" % sys.argv[pos + 2])
+        return
+
+    if "--curve" in sys.argv[1:]:
+        print_convergence(filt, engine)
+        return
+
     # ---------- Floating point -------------
 
-    waveout = wave.open("float.wav", "w")
-    waveout.setnchannels(1)
-    waveout.setsampwidth(2)
-    waveout.setframerate(samplerate)
-    waveout.setcomptype("NONE", "Uncompressed")
-    sbuf = array.array('h')
+    waveout = wavio.WavSink("float.wav", samplerate)
 
     # Initialize noise and signal+noise buffers
     nbuf = [0 for x in range(blocksize)]
@@ -215,16 +737,15 @@ def main():
                 nsbuf[j] = (noise + signal) / 2.0
 
             # Run block through adaptive filter
-            out = af.filter(nsbuf, nbuf)
+            out = filt.filter(nsbuf, nbuf)
 
-            # Append data output buffer
-            for j in range(blocksize):
-                sbuf.append(int(out[j] * (2**(bits - 1))))
+            # Write output block
+            waveout.write(out)
 
-    waveout.writeframes(sbuf.tostring())
     waveout.close()
     print("Wrote file float.wav")
     return
 
 
-main()
+if __name__ == "__main__":
+    main()
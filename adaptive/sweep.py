@@ -0,0 +1,186 @@
+#------------------------------------------------------------------------------
+# Parallel adaptive filter parameter sweep.
+#
+# Every (engine, roc, blocksize, frequency) configuration is an independent
+# job run in a process pool. Finished results are appended to a cache file
+# one JSON object per line, so an interrupted sweep resumes where it was
+# left off.
+#------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import multiprocessing
+
+import numpy
+
+import adapt
+
+#------------------------------------------------------------------------------
+# Class definitions
+#------------------------------------------------------------------------------
+
+
+# Result of one configuration
+class SweepResult:
+    # Constructor
+    def __init__(self, engine_, roc_, blocksize_, freq_, residual_, time_,
+                 misadjustment_):
+        self.engine = engine_
+        self.roc = roc_
+        self.blocksize = blocksize_
+        self.freq = freq_
+        self.residual = residual_
+        self.time = time_
+        self.misadjustment = misadjustment_
+        return
+
+    # Cache key of the configuration
+    def key(self):
+        return config_key(self.engine, self.roc, self.blocksize, self.freq)
+
+
+#------------------------------------------------------------------------------
+# Sweep functions
+#------------------------------------------------------------------------------
+
+
+# Cache key of configuration
+def config_key(engine, roc, blocksize, freq):
+    return "%s,%r,%d,%d" % (engine, float(roc), blocksize, freq)
+
+
+# Run one configuration, job is (engine, roc, blocksize, frequency).
+# Residual is the final residual noise power in dB and time the samples
+# until convergence. The signal is the smallest possible error of the
+# canceller, so misadjustment is the final residual (excess error) relative
+# to the signal power.
+def run_job(job):
+    engine, roc, blocksize, freq = job
+    filt = adapt.make_filter(engine, blocksize, roc)
+    row = adapt.convergence_curve(filt, [adapt.Freq(freq)], adapt.scount,
+                                  blocksize)[0]
+
+    residual = float(numpy.median(row[-max(len(row) // 4, 1):]))
+    time = int(adapt.convergence_time(row, blocksize))
+    misadjustment = 10.0**(residual / 10.0) / signal_power
+    return SweepResult(engine, roc, blocksize, freq, residual, time,
+                       misadjustment)
+
+
+# Load finished results from cache file, returns {key: result}
+def load_results(filename):
+    results = {}
+    if not os.path.exists(filename):
+        return results
+
+    with open(filename) as cachefile:
+        for line in cachefile:
+            # Last line can be cut short by an interrupted run
+            try:
+                result = SweepResult(**json.loads(line))
+            except (ValueError, TypeError):
+                continue
+            results[result.key()] = result
+    return results
+
+
+# Run all configurations that are not in the cache file, returns
+# {key: result} of the whole grid
+def sweep(engines, rocs, blocksizes, freqs, filename, processes=None):
+    results = load_results(filename)
+    jobs = [(engine, roc, blocksize, freq)
+            for engine in engines
+            for roc in rocs
+            for blocksize in blocksizes
+            for freq in freqs
+            if config_key(engine, roc, blocksize, freq) not in results]
+
+    if jobs:
+        pool = multiprocessing.Pool(processes)
+        try:
+            with open(filename, "a+") as cachefile:
+                # Start a new line after a line cut short
+                cachefile.seek(0, 2)
+                if cachefile.tell():
+                    cachefile.seek(cachefile.tell() - 1)
+                    if cachefile.read(1) != "\n":
+                        cachefile.write("\n")
+
+                for result in pool.imap_unordered(run_job, jobs):
+                    results[result.key()] = result
+                    cachefile.write(json.dumps({
+                        "engine_": result.engine,
+                        "roc_": result.roc,
+                        "blocksize_": result.blocksize,
+                        "freq_": result.freq,
+                        "residual_": result.residual,
+                        "time_": result.time,
+                        "misadjustment_": result.misadjustment
+                    }) + "\n")
+                    cachefile.flush()
+        finally:
+            pool.close()
+            pool.join()
+
+    return results
+
+
+# Print results table, one line per configuration averaged over frequencies
+def print_results(engines, rocs, blocksizes, freqs, results):
+    print "-----------------------------------------------------------------"
+    print " Engine      roc  Block   Residual  Conv. mean/max  Misadjustment"
+    print "-----------------------------------------------------------------"
+    for engine in engines:
+        for roc in rocs:
+            for blocksize in blocksizes:
+                rows = [results[config_key(engine, roc, blocksize, freq)]
+                        for freq in freqs]
+                print "%-6s %8.4f %6d %7.1f dB %6d/%6d %14.2e" % \
+                 (engine, roc, blocksize,
+                  numpy.mean([r.residual for r in rows]),
+                  numpy.mean([r.time for r in rows]),
+                  max([r.time for r in rows]),
+                  numpy.mean([r.misadjustment for r in rows]))
+    return
+
+
+#------------------------------------------------------------------------------
+# Data tables and general settings
+#------------------------------------------------------------------------------
+
+# Power of the signal in the test harness
+signal_power = numpy.mean((adapt.IIRSineGenerator(adapt.samplerate)
+                           .generate_block(adapt.scount) / 2.0)**2)
+
+# Parameter grids
+engine_grid = ["lms", "nlms"]
+roc_grid = [0.001, 0.003, 0.01, 0.03, 0.1]
+blocksize_grid = [16, 32, 64]
+
+# Test frequencies (not the 1000 Hz of the signal, it would be cancelled)
+freq_grid = [100, 500, 1500, 2000, 4000, 7000]
+
+# Result cache (next to this file, not in the working directory)
+cache_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "sweep.jsonl")
+
+#------------------------------------------------------------------------------
+# Main functions
+#------------------------------------------------------------------------------
+
+
+# Main function
+def main():
+    processes = None
+    if len(sys.argv) > 1:
+        processes = int(sys.argv[1])
+
+    results = sweep(engine_grid, roc_grid, blocksize_grid, freq_grid,
+                    cache_file, processes)
+    print_results(engine_grid, roc_grid, blocksize_grid, freq_grid, results)
+    return
+
+
+if __name__ == "__main__":
+    main()
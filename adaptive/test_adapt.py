@@ -0,0 +1,283 @@
+#------------------------------------------------------------------------------
+# Tests of the vectorized adaptive filters of adapt.py
+#
+# Run with: python -m unittest discover -s adaptive
+#------------------------------------------------------------------------------
+
+import unittest
+
+import numpy
+
+import adapt
+
+
+# Per-sample LMS/NLMS reference over (references, samples) noise, returns
+# (errors, coeffs) with coeffs of (channels, references * taps)
+def reference_lms(swn, noise, taps, roc, mode):
+    swn = numpy.atleast_2d(swn)
+    noise = numpy.atleast_2d(noise)
+    history = numpy.concatenate(
+        (numpy.zeros((len(noise), taps - 1)), noise), axis=1)
+    coeffs = numpy.zeros((len(swn), len(noise) * taps))
+    out = numpy.empty(swn.shape)
+
+    for i in range(swn.shape[1]):
+        x = history[:, i:i + taps][:, ::-1].ravel()
+        e = swn[:, i] - coeffs.dot(x)
+        if mode == "lms":
+            step = 2 * roc
+        else:
+            step = roc / (adapt.nlms_delta + x.dot(x))
+        coeffs += step * numpy.outer(e, x)
+        out[:, i] = e
+
+    return out, coeffs
+
+
+# Run filt over the signals block by block, returns the errors
+def run_blocks(filt, swn, noise, single=True):
+    blocks = []
+    for start in range(0, swn.shape[-1], filt.blocksize):
+        end = start + filt.blocksize
+        if single:
+            blocks.append(filt.filter(swn[start:end], noise[start:end]))
+        else:
+            blocks.append(filt.filter(swn[:, start:end], noise[:, start:end]))
+    return numpy.concatenate(blocks, axis=-1)
+
+
+# Noise and a primary with filtered noise plus a weak signal, small enough
+# to keep LMS stable with the test steps
+def make_signals(random, count, channels=None, references=1):
+    noise = 0.3 * random.randn(references, count)
+    swn = 0.03 * random.randn(channels or 1, count)
+    for c in range(len(swn)):
+        for r in range(references):
+            response = random.randn(5) * 0.5
+            swn[c] += numpy.convolve(noise[r], response)[:count]
+    if channels == None:
+        return swn[0], noise[0]
+    return swn, noise
+
+
+class VectorLMSTest(unittest.TestCase):
+    """VectorAdaptiveFilter LMS against the list-based AdaptiveFilter"""
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(21)
+        return
+
+    def test_matches_adaptive_filter(self):
+        for blocksize, roc in [(32, 0.01), (32, 0.05), (100, 0.002)]:
+            swn, noise = make_signals(self.random, 20 * blocksize)
+            reference = adapt.AdaptiveFilter(blocksize, roc)
+            vector = adapt.VectorAdaptiveFilter(blocksize, roc)
+
+            for start in range(0, len(swn), blocksize):
+                end = start + blocksize
+                expected = reference.filter(swn[start:end].tolist(),
+                                            noise[start:end].tolist())
+                numpy.testing.assert_allclose(
+                    vector.filter(swn[start:end], noise[start:end]),
+                    expected, rtol=1e-9, atol=1e-12)
+
+            numpy.testing.assert_allclose(vector.coeffs, reference.coeffs,
+                                          rtol=1e-9, atol=1e-12)
+        return
+
+    def test_taps_differ_from_blocksize(self):
+        for blocksize, taps in [(32, 100), (100, 17), (16, 200)]:
+            swn, noise = make_signals(self.random, 10 * blocksize)
+            expected, coeffs = reference_lms(swn, noise, taps, 0.001, "lms")
+            filt = adapt.VectorAdaptiveFilter(blocksize, 0.001, taps)
+            numpy.testing.assert_allclose(run_blocks(filt, swn, noise),
+                                          expected[0], rtol=1e-9, atol=1e-12)
+            numpy.testing.assert_allclose(filt.coeffs, coeffs[0], rtol=0,
+                                          atol=1e-12)
+        return
+
+    def test_numpy_solve_fallback(self):
+        a = self.random.randn(20, 20)
+        b = self.random.randn(20, 3)
+        expected = numpy.linalg.solve(numpy.tril(a, -1) + numpy.eye(20), b)
+        numpy.testing.assert_allclose(adapt.lower_solve_numpy(a, b),
+                                      expected, rtol=1e-9, atol=1e-12)
+        numpy.testing.assert_allclose(adapt.lower_solve_numpy(a, b[:, 0]),
+                                      expected[:, 0], rtol=1e-9, atol=1e-12)
+
+        swn, noise = make_signals(self.random, 640)
+        expected, coeffs = reference_lms(swn, noise, 32, 0.01, "lms")
+        scipy, adapt.scipy = adapt.scipy, None
+        try:
+            filt = adapt.VectorAdaptiveFilter(32, 0.01)
+            out = run_blocks(filt, swn, noise)
+        finally:
+            adapt.scipy = scipy
+        numpy.testing.assert_allclose(out, expected[0], rtol=1e-9, atol=1e-12)
+        return
+
+
+# Per-sample textbook RLS reference, returns (errors, coeffs)
+def reference_rls(swn, noise, taps):
+    history = numpy.concatenate((numpy.zeros(taps - 1), noise))
+    inverse = numpy.eye(taps) / adapt.rls_delta
+    coeffs = numpy.zeros(taps)
+    out = numpy.empty(len(swn))
+
+    for i in range(len(swn)):
+        x = history[i:i + taps][::-1]
+        e = swn[i] - coeffs.dot(x)
+        gain = inverse.dot(x) / (adapt.rls_forget + x.dot(inverse).dot(x))
+        coeffs = coeffs + gain * e
+        inverse = (inverse - numpy.outer(gain, x.dot(inverse))) / \
+         adapt.rls_forget
+        out[i] = e
+
+    return out, coeffs
+
+
+class VectorNLMSTest(unittest.TestCase):
+    """VectorAdaptiveFilter NLMS against a per-sample reference"""
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(23)
+        return
+
+    def test_matches_reference(self):
+        for blocksize, taps, roc in [(32, 32, 0.5), (100, 17, 0.3),
+                                     (16, 200, 0.8)]:
+            swn, noise = make_signals(self.random, 20 * blocksize)
+            expected, coeffs = reference_lms(swn, noise, taps, roc, "nlms")
+            filt = adapt.VectorAdaptiveFilter(blocksize, roc, taps, "nlms")
+            numpy.testing.assert_allclose(run_blocks(filt, swn, noise),
+                                          expected[0], rtol=1e-9, atol=1e-12)
+            numpy.testing.assert_allclose(filt.coeffs, coeffs[0], rtol=1e-9,
+                                          atol=1e-12)
+        return
+
+
+class VectorRLSTest(unittest.TestCase):
+    """VectorAdaptiveFilter RLS against a per-sample reference"""
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(23)
+        return
+
+    def test_matches_reference(self):
+        # Broadband noise keeps the inverse bounded, so the trace limit
+        # never takes effect
+        for blocksize, taps in [(32, 16), (16, 40)]:
+            swn, noise = make_signals(self.random, 20 * blocksize)
+            expected, coeffs = reference_rls(swn, noise, taps)
+            filt = adapt.VectorAdaptiveFilter(blocksize, 0, taps, "rls")
+            numpy.testing.assert_allclose(run_blocks(filt, swn, noise),
+                                          expected, rtol=1e-7, atol=1e-10)
+            numpy.testing.assert_allclose(filt.coeffs, coeffs, rtol=1e-7,
+                                          atol=1e-10)
+        return
+
+    def test_tones_stay_stable(self):
+        # Single tones used to wind the inverse up until it diverged
+        filt = adapt.make_filter("rls", adapt.blocksize, adapt.roc)
+        freqs = adapt.freqtable[::4]
+        curve = adapt.convergence_curve(filt, freqs)
+
+        for freq, row in zip(freqs, curve):
+            residual = numpy.median(row[-len(row) // 4:])
+            self.assertTrue(residual < -10.0,
+                            "%d Hz: %.1f dB" % (freq.freq, residual))
+
+        inverse = filt.inverse
+        self.assertEqual(abs(inverse - inverse.T).max(), 0.0)
+        self.assertTrue(numpy.trace(inverse) <= 1.000001 * filt.taps /
+                        adapt.rls_delta)
+        self.assertTrue(numpy.linalg.eigvalsh(inverse).min() > 0.0)
+        return
+
+
+class MultiChannelTest(unittest.TestCase):
+    """MultiChannelAdaptiveFilter against single-channel filters"""
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(24)
+        return
+
+    def test_channels_match_single_filters(self):
+        blocksize, taps, channels = 32, 24, 3
+        for mode, roc in [("lms", 0.01), ("nlms", 0.5), ("rls", 0)]:
+            swn, noise = make_signals(self.random, 15 * blocksize, channels)
+            multi = adapt.MultiChannelAdaptiveFilter(blocksize, roc, channels,
+                                                     1, taps, mode)
+            out = run_blocks(multi, swn, noise, False)
+
+            for c in range(channels):
+                single = adapt.VectorAdaptiveFilter(blocksize, roc, taps,
+                                                    mode)
+                numpy.testing.assert_allclose(
+                    out[c], run_blocks(single, swn[c], noise[0]), rtol=1e-9,
+                    atol=1e-12, err_msg="%s channel %d" % (mode, c))
+                numpy.testing.assert_allclose(multi.coeffs[c, 0],
+                                              single.coeffs, rtol=1e-9,
+                                              atol=1e-12)
+        return
+
+    def test_references_match_reference(self):
+        blocksize, taps, channels, references = 32, 24, 3, 2
+        for mode, roc in [("lms", 0.005), ("nlms", 0.4)]:
+            swn, noise = make_signals(self.random, 10 * blocksize, channels,
+                                      references)
+            expected, coeffs = reference_lms(swn, noise, taps, roc, mode)
+            multi = adapt.MultiChannelAdaptiveFilter(blocksize, roc, channels,
+                                                     references, taps, mode)
+            out = run_blocks(multi, swn, noise, False)
+            numpy.testing.assert_allclose(out, expected, rtol=1e-9,
+                                          atol=1e-12)
+            numpy.testing.assert_allclose(multi.coeffs.reshape(channels, -1),
+                                          coeffs, rtol=1e-9, atol=1e-12)
+        return
+
+    def test_block_shape_is_checked(self):
+        multi = adapt.MultiChannelAdaptiveFilter(32, 0.01, 2, 1)
+        self.assertRaises(ValueError, multi.filter, numpy.zeros((3, 32)),
+                          numpy.zeros((1, 32)))
+        self.assertRaises(ValueError, multi.filter, numpy.zeros((2, 32)),
+                          numpy.zeros((2, 32)))
+        return
+
+
+class FrequencyDomainTest(unittest.TestCase):
+    """FrequencyDomainAdaptiveFilter convergence in the test harness"""
+
+    def assert_bounded(self, filt, freqs):
+        curve = adapt.convergence_curve(filt, freqs)
+        for freq, row in zip(freqs, curve):
+            residual = numpy.median(row[-len(row) // 4:])
+            message = "roc %g, %d Hz" % (filt.roc, freq.freq)
+            self.assertTrue(residual < -10.0,
+                            "%s: %.1f dB" % (message, residual))
+            self.assertTrue(row.max() < 0.0,
+                            "%s: peak %.1f dB" % (message, row.max()))
+        return
+
+    def test_tone_sweep_is_bounded(self):
+        # Bins with signal but no reference power used to get huge steps
+        self.assert_bounded(
+            adapt.make_filter("fdaf", adapt.blocksize, adapt.fdaf_roc),
+            adapt.freqtable)
+        self.assert_bounded(adapt.make_filter("fdaf", adapt.blocksize, 1.0),
+                            adapt.freqtable[::3])
+        return
+
+    def test_broadband_converges(self):
+        random = numpy.random.RandomState(22)
+        swn, noise = make_signals(random, 200 * 32)
+        filt = adapt.FrequencyDomainAdaptiveFilter(32, adapt.fdaf_roc)
+        out = run_blocks(filt, swn, noise)
+
+        # Residual ends close to the 0.03 rms signal
+        self.assertTrue(out[-1024:].std() < 0.05, out[-1024:].std())
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#------------------------------------------------------------------------------
+# Block test signal generators shared by the test programs.
+#
+# Phase is carried over between blocks and kept wrapped to [0, 2pi), so
+# blocks are continuous and precision does not drift on long runs.
+#------------------------------------------------------------------------------
+
+import math
+import numpy
+
+#------------------------------------------------------------------------------
+# Class definitions
+#------------------------------------------------------------------------------
+
+
+# Sum of sines with fixed frequencies and amplitudes
+class MultiToneGenerator:
+    # Constructor (amplitudes default to 1 / number of tones)
+    def __init__(self, samplerate_, freqs_, amplitudes_=None):
+        self.samplerate = samplerate_
+        self.freqs = numpy.array(freqs_, dtype=numpy.float64)
+        if amplitudes_ is None:
+            amplitudes_ = numpy.ones(len(self.freqs)) / len(self.freqs)
+        self.amplitudes = numpy.array(amplitudes_, dtype=numpy.float64)
+        self.steps = 2.0 * math.pi * self.freqs / samplerate_
+        self.phases = numpy.zeros(len(self.freqs))
+        return
+
+    # Generate block of count samples
+    def generate_block(self, count):
+        k = numpy.arange(1, count + 1)
+        angles = self.phases[:, numpy.newaxis] + \
+         self.steps[:, numpy.newaxis] * k
+        self.phases = numpy.fmod(self.phases + self.steps * count,
+                                 2.0 * math.pi)
+        return self.amplitudes.dot(numpy.sin(angles))
+
+
+# Swept sine from freq0 to freq1 over length samples, then starting over.
+# Sweep is "linear" or "log" (constant octaves per second).
+class ChirpGenerator:
+    # Constructor
+    def __init__(self, samplerate_, freq0_, freq1_, length_, sweep_="linear"):
+        if sweep_ not in ("linear", "log"):
+            raise ValueError("Unknown sweep: %s" % sweep_)
+        if sweep_ == "log" and (freq0_ <= 0 or freq1_ <= 0):
+            raise ValueError("Log sweep needs positive frequencies")
+
+        self.samplerate = samplerate_
+        self.freq0, self.freq1 = float(freq0_), float(freq1_)
+        self.length = length_
+        self.sweep = sweep_
+        self.pos = 0
+        self.phase = 0.0
+        return
+
+    # Instantaneous frequencies at sweep positions
+    def frequencies(self, pos):
+        ratio = pos / float(self.length)
+        if self.sweep == "linear":
+            return self.freq0 + (self.freq1 - self.freq0) * ratio
+        return self.freq0 * (self.freq1 / self.freq0)**ratio
+
+    # Generate block of count samples
+    def generate_block(self, count):
+        pos = (self.pos + numpy.arange(count)) % self.length
+        steps = 2.0 * math.pi * self.frequencies(pos) / self.samplerate
+        angles = self.phase + numpy.cumsum(steps)
+
+        self.pos = (self.pos + count) % self.length
+        if count:
+            self.phase = math.fmod(angles[-1], 2.0 * math.pi)
+        return numpy.sin(angles)
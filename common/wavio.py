@@ -0,0 +1,244 @@
+#------------------------------------------------------------------------------
+# WAV file helpers shared by the test programs.
+#
+# Programs add this directory to sys.path and import wavio.
+#------------------------------------------------------------------------------
+
+import wave
+import array
+import struct
+
+# NumPy is needed by the vectorized conversion and the memory-mapped sources
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#------------------------------------------------------------------------------
+# Data tables and general settings
+#------------------------------------------------------------------------------
+
+# Frames written at a time
+default_chunksize = 4096
+
+# 16-bit sample range
+int16_min = -32768
+int16_max = 32767
+
+#------------------------------------------------------------------------------
+# Class definitions
+#------------------------------------------------------------------------------
+
+
+# Streaming 16-bit WAV writer. Samples are converted, clipped and buffered
+# into a fixed size chunk that is written out whenever it fills up, so
+# memory use does not grow with the length of the run.
+class WavSink:
+    # Constructor
+    def __init__(self,
+                 filename_,
+                 samplerate_,
+                 channels_=1,
+                 chunksize_=default_chunksize):
+        self.filename = filename_
+        self.channels = channels_
+        self.size = chunksize_ * channels_
+        self.clipped = 0
+
+        self.waveout = wave.open(filename_, "w")
+        self.waveout.setnchannels(channels_)
+        self.waveout.setsampwidth(2)
+        self.waveout.setframerate(samplerate_)
+        self.waveout.setcomptype("NONE", "Uncompressed")
+
+        if numpy is not None:
+            self.chunk = numpy.empty(self.size, dtype=numpy.int16)
+        else:
+            self.chunk = array.array('h', [0] * self.size)
+        self.filled = 0
+        return
+
+    # Write float samples, full scale is [-1, 1). Multichannel samples are
+    # interleaved or (frames, channels) arrays.
+    def write(self, samples):
+        self.put(samples, 2**15)
+        return
+
+    # Write integer samples as they are (clipped to 16 bits)
+    def write_int(self, samples):
+        self.put(samples, 1)
+        return
+
+    # Scale, truncate towards zero and clip samples into the chunk
+    def put(self, samples, scale):
+        if numpy is None:
+            self.put_list(samples, scale)
+            return
+
+        samples = numpy.asarray(samples).ravel()
+        pos = 0
+        while pos < len(samples):
+            count = min(self.size - self.filled, len(samples) - pos)
+            piece = samples[pos:pos + count] * scale
+            if piece.dtype.kind == 'f':
+                piece = numpy.trunc(piece)
+            over = (piece < int16_min) | (piece > int16_max)
+            if over.any():
+                self.clipped += numpy.count_nonzero(over)
+                piece = numpy.clip(piece, int16_min, int16_max)
+
+            self.chunk[self.filled:self.filled + count] = piece
+            self.filled += count
+            pos += count
+            if self.filled == self.size:
+                self.flush()
+        return
+
+    # Conversion without NumPy, one sample at a time
+    def put_list(self, samples, scale):
+        for sample in samples:
+            sample = int(sample * scale)
+            if sample < int16_min or sample > int16_max:
+                self.clipped += 1
+                sample = min(max(sample, int16_min), int16_max)
+
+            self.chunk[self.filled] = sample
+            self.filled += 1
+            if self.filled == self.size:
+                self.flush()
+        return
+
+    # Write buffered frames to the file
+    def flush(self):
+        if self.filled:
+            data = self.chunk[:self.filled]
+            if hasattr(data, "tobytes"):
+                data = data.tobytes()
+            else:
+                data = data.tostring()
+            self.waveout.writeframesraw(data)
+            self.filled = 0
+        return
+
+    # Flush and close the file (header gets its final length)
+    def close(self):
+        self.flush()
+        self.waveout.close()
+        return
+
+    # Context manager support
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+# Memory-mapped raw PCM source. Blocks are zero-copy int16 views of the
+# file or float blocks converted one block at a time, so files of any size
+# can be streamed through the filters.
+class RawSource:
+    # Constructor (offset is the byte offset of the first frame)
+    def __init__(self, filename_, samplerate_, channels_=1, offset_=0,
+                 frames_=None):
+        if numpy is None:
+            raise ImportError("RawSource requires numpy")
+
+        self.filename = filename_
+        self.samplerate = samplerate_
+        self.channels = channels_
+
+        # Whole frames from offset to the end of file by default
+        if frames_ == None:
+            with open(filename_, "rb") as rawfile:
+                rawfile.seek(0, 2)
+                frames_ = max(rawfile.tell() - offset_, 0) // (2 * channels_)
+        self.frames = frames_
+
+        if frames_:
+            self.data = numpy.memmap(filename_, dtype="<i2", mode="r",
+                                     offset=offset_,
+                                     shape=(frames_, channels_))
+        else:
+            self.data = numpy.zeros((0, channels_), dtype="<i2")
+        return
+
+    # Number of frames
+    def __len__(self):
+        return self.frames
+
+    # Generate int16 views of blocksize frames (the last one can be
+    # shorter), shaped (frames, channels) or (frames) for one channel
+    def int_blocks(self, blocksize, channel=None):
+        for start in range(0, self.frames, blocksize):
+            block = self.data[start:start + blocksize]
+            if channel != None:
+                block = block[:, channel]
+            yield block
+        return
+
+    # Generate float blocks in [-1, 1), channel None mixes all channels,
+    # pad fills the last block up to blocksize with zeros
+    def float_blocks(self, blocksize, channel=None, pad=False):
+        for block in self.int_blocks(blocksize, channel):
+            if channel == None:
+                block = block.mean(axis=1)
+            block = block * (1.0 / 2**15)
+            if pad and len(block) < blocksize:
+                block = numpy.concatenate(
+                    (block, numpy.zeros(blocksize - len(block))))
+            yield block
+        return
+
+
+# Memory-mapped 16-bit PCM WAV source, see RawSource
+class WavSource(RawSource):
+    # Constructor
+    def __init__(self, filename_):
+        offset, frames, channels, samplerate = wav_layout(filename_)
+        RawSource.__init__(self, filename_, samplerate, channels, offset,
+                           frames)
+        return
+
+
+#------------------------------------------------------------------------------
+# Functions
+#------------------------------------------------------------------------------
+
+
+# Find data chunk of a 16-bit PCM WAV file, returns
+# (data offset, frames, channels, samplerate)
+def wav_layout(filename):
+    with open(filename, "rb") as wavfile:
+        riff, size, form = struct.unpack("<4sI4s", wavfile.read(12))
+        if riff != b"RIFF" or form != b"WAVE":
+            raise ValueError("Not a WAV file: %s" % filename)
+
+        fmt = None
+        while True:
+            header = wavfile.read(8)
+            if len(header) < 8:
+                raise ValueError("No data chunk in %s" % filename)
+            chunkid, size = struct.unpack("<4sI", header)
+
+            if chunkid == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", wavfile.read(16))
+                wavfile.seek(size - 16 + (size & 1), 1)
+            elif chunkid == b"data":
+                break
+            else:
+                wavfile.seek(size + (size & 1), 1)
+
+        if fmt == None:
+            raise ValueError("No format chunk in %s" % filename)
+        tag, channels, samplerate, byterate, align, width = fmt
+        if tag not in (1, 0xfffe) or width != 16:
+            raise ValueError("Only 16-bit PCM WAV files are supported")
+
+        # Data size can be wrong in files that were never closed
+        offset = wavfile.tell()
+        wavfile.seek(0, 2)
+        size = min(size, wavfile.tell() - offset)
+
+    return offset, size // (2 * channels), channels, samplerate
@@ -0,0 +1,195 @@
+#------------------------------------------------------------------------------
+# Elliptic IIR filter designer.
+#
+# Python port of iirfilter.m: ellip -> zp2sos -> gain distribution -> L2-norm
+# scaling -> prescale -> quantization. Designs are memoized in a JSON-lines
+# file keyed by the design parameters, so batches of filter variants can be
+# regenerated without MATLAB/Octave. New designs are appended one line at a
+# time, so parallel processes can share the file without losing entries.
+#------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import math
+
+import numpy
+import scipy.signal
+
+import iir
+
+#------------------------------------------------------------------------------
+# Data tables and general settings
+#------------------------------------------------------------------------------
+
+# Impulse response length used for the L2-norms (impz in iirfilter.m)
+l2_length = 80
+
+# Default design cache
+design_cache_file = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "designs.jsonl")
+
+# Loaded design caches by file name
+design_caches = {}
+
+#------------------------------------------------------------------------------
+# Design functions
+#------------------------------------------------------------------------------
+
+
+# MATLAB round, halves away from zero
+def matlab_round(x):
+    return numpy.sign(x) * numpy.floor(numpy.abs(x) + 0.5)
+
+
+# Calculate IIR filter coefficients like iirfilter.m, returns
+# (prescale, scoeffs, qcoeffs) with rows of (a1, a2, b0, b1, b2). Fend is
+# unused, as in iirfilter.m the bandpass variant is disabled.
+def iirfilter(Fs, Fstart, Fend, Rpass, Rstop, order, bits):
+    if order < 2 or order % 2:
+        raise ValueError("Filter order must be even")
+    count = order // 2
+
+    # Elliptic lowpass as second order sections
+    freq_start = float(Fstart) / (Fs / 2.0)
+    z, p, k = scipy.signal.ellip(order, Rpass, Rstop, freq_start,
+                                 output="zpk")
+    coeffs = scipy.signal.zpk2sos(z, p, 1.0)
+
+    # Scale numerators with gain
+    coeffs[:, 0:3] *= math.sqrt(k)
+
+    # L2-norm of each all-pole part, extra 1 eases scaling
+    impulse = numpy.zeros(l2_length)
+    impulse[0] = 1.0
+    l2 = numpy.ones(count + 1)
+    for i in range(count):
+        h = scipy.signal.lfilter([1.0], coeffs[i, 3:6], impulse)
+        l2[i] = math.sqrt(numpy.sum(h**2))
+
+    for i in range(count):
+        coeffs[i, 0:3] /= l2[i] / l2[i + 1]
+
+    # Negate a1 and a2, shuffle to a1, a2, b0, b1, b2
+    scoeffs = numpy.column_stack((-coeffs[:, 4:6], coeffs[:, 0:3]))
+    prescale = l2[0]
+
+    qcoeffs = matlab_round(scoeffs * 2**(bits - 1)).astype(numpy.int64)
+    return prescale, scoeffs, qcoeffs
+
+
+# Cache key of design parameters
+def design_key(Fs, Fstart, Fend, Rpass, Rstop, order, bits):
+    return ",".join([repr(float(value))
+                     for value in (Fs, Fstart, Fend, Rpass, Rstop)] +
+                    [str(int(order)), str(int(bits))])
+
+
+# Read design cache file, returns {key: entry}
+def read_cache(filename):
+    cache = {}
+    if not os.path.exists(filename):
+        return cache
+
+    with open(filename) as cachefile:
+        for line in cachefile:
+            # A line can be cut short by an interrupted run
+            try:
+                entry = json.loads(line)
+                cache[entry["key"]] = entry
+            except (ValueError, KeyError, TypeError):
+                continue
+    return cache
+
+
+# Get design cache from memory or disk
+def load_cache(filename):
+    if filename not in design_caches:
+        design_caches[filename] = read_cache(filename)
+    return design_caches[filename]
+
+
+# Append design entry to cache file with a single write
+def save_design(filename, entry):
+    line = json.dumps(entry, sort_keys=True) + "\n"
+    with open(filename, "a+") as cachefile:
+        # Start a new line after a line cut short
+        cachefile.seek(0, 2)
+        if cachefile.tell():
+            cachefile.seek(cachefile.tell() - 1)
+            if cachefile.read(1) != "\n":
+                line = "\n" + line
+        cachefile.seek(0, 2)
+        cachefile.write(line)
+    return
+
+
+# Memoized iirfilter, cachefile None uses design_cache_file
+def design(Fs, Fstart, Fend, Rpass, Rstop, order, bits, cachefile=None):
+    if cachefile == None:
+        cachefile = design_cache_file
+    cache = load_cache(cachefile)
+    key = design_key(Fs, Fstart, Fend, Rpass, Rstop, order, bits)
+
+    # Other processes may have added the design since the cache was read
+    if key not in cache:
+        cache.update(read_cache(cachefile))
+
+    if key not in cache:
+        prescale, scoeffs, qcoeffs = iirfilter(Fs, Fstart, Fend, Rpass,
+                                               Rstop, order, bits)
+        cache[key] = {
+            "key": key,
+            "prescale": prescale,
+            "scoeffs": scoeffs.tolist(),
+            "qcoeffs": qcoeffs.tolist()
+        }
+        save_design(cachefile, cache[key])
+
+    entry = cache[key]
+    return (entry["prescale"], numpy.array(entry["scoeffs"]),
+            numpy.array(entry["qcoeffs"], dtype=numpy.int64))
+
+
+# Make SecondOrderSection list from coefficient rows
+def make_sections(coeffs):
+    return [iir.SecondOrderSection(*row) for row in coeffs.tolist()]
+
+
+#------------------------------------------------------------------------------
+# Main functions
+#------------------------------------------------------------------------------
+
+
+# Main function
+def main():
+    if len(sys.argv) < 8:
+        print "Usage: python design.py <Fs> <Fstart> <Fend> <Rpass> <Rstop> " \
+              "<order> <bits>"
+        return
+
+    Fs, Fstart, Fend, Rpass, Rstop = map(float, sys.argv[1:6])
+    order, bits = int(sys.argv[6]), int(sys.argv[7])
+    prescale, scoeffs, qcoeffs = design(Fs, Fstart, Fend, Rpass, Rstop,
+                                        order, bits)
+
+    # Print in the format of the tables in iir.py
+    print "# Incoming sample scaling"
+    print "prescale = %.4f" % prescale
+    print ""
+    print "# Second order sections with coefficients (floating point)"
+    print "sections = ["
+    print ",\n".join(["    SecondOrderSection(%.4f, %.4f, %.4f, %.4f, %.4f)" %
+                      tuple(row) for row in scoeffs])
+    print "]"
+    print ""
+    print "# Second order sections with coefficients (fixed point)"
+    print "intsections = ["
+    print ",\n".join(["    SecondOrderSection(%d, %d, %d, %d, %d)" %
+                      tuple(row) for row in qcoeffs])
+    print "]"
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,26 @@
 # Harri Salokorpi, 2004
 #------------------------------------------------------------------------------
 
+import os
+import sys
 import math
-import wave
-import array
+
+# Shared modules
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                    "common"))
+import wavio
+
+# NumPy and SciPy are needed only by the vectorized filters
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import scipy.signal
+except ImportError:
+    scipy = None
 
 #------------------------------------------------------------------------------
 # Class definitions
@@ -68,6 +85,416 @@ class SecondOrderSection:
         return sample
 
 
+# Cascade of second order sections, filters whole blocks
+class Cascade:
+    # Constructor (giving bits-parameter enables the integer mode)
+    def __init__(self, sections_, bits_=None):
+        self.sections = sections_
+        self.bits = bits_
+        return
+
+    # Filter block of samples. Filter state stays in the sections, so
+    # block-by-block and sample-by-sample filtering give the same result.
+    def filter(self, block):
+        if hasattr(block, "tolist"):
+            out = block.tolist()
+        else:
+            out = list(block)
+        count = len(out)
+
+        for sos in self.sections:
+            a1, a2 = sos.a1, sos.a2
+            b0, b1, b2 = sos.b0, sos.b1, sos.b2
+            w1, w2 = sos.buf[1], sos.buf[2]
+
+            if self.bits == None:
+                # Floatpoint mode
+                for i in range(count):
+                    w0 = out[i] + a1 * w1 + a2 * w2
+                    out[i] = b0 * w0 + b1 * w1 + b2 * w2
+                    w1, w2 = w0, w1
+            else:
+                # Integer mode
+                scale = 2**(self.bits - 1)
+                for i in range(count):
+                    w0 = out[i] + (a1 * w1) / scale + (a2 * w2) / scale
+                    out[i] = (b0 * w0) / scale + (b1 * w1) / scale + \
+                     (b2 * w2) / scale
+                    w1, w2 = w0, w1
+
+            sos.buf[0], sos.buf[1], sos.buf[2] = w1, w1, w2
+
+        return out
+
+    # Filter block with sosfilt (floatpoint mode only), returns numpy array
+    def filter_array(self, block, backend=None):
+        if self.bits != None:
+            raise ValueError("filter_array supports only floatpoint mode")
+
+        zi = [sos.buf[1:3] for sos in self.sections]
+        out, zf = sosfilt(sos_coeffs(self.sections), block, zi, backend)
+
+        for sos, state in zip(self.sections, zf):
+            sos.buf[0], sos.buf[1], sos.buf[2] = state[0], state[0], state[1]
+        return out
+
+
+#------------------------------------------------------------------------------
+# Vectorized SOS filtering
+#
+# Coefficients are rows of (a1, a2, b0, b1, b2) like in SecondOrderSection,
+# and state is (w1, w2) per section, i.e. SecondOrderSection.buf[1:3]:
+#
+#	w[n] = x[n] + a1 * w[n-1] + a2 * w[n-2]
+#	y[n] = b0 * w[n] + b1 * w[n-1] + b2 * w[n-2]
+#
+# The recursive part runs in scipy.signal.lfilter when SciPy is available.
+# The NumPy fallback splits the signal into blocks: zero-state responses of
+# all blocks are one matrix product, block boundary states are solved with
+# a parallel prefix scan, and the state responses are added with another
+# matrix product.
+#------------------------------------------------------------------------------
+
+# Block length of the NumPy state-space filter
+sos_blocklen = 64
+
+# Samples filtered at a time (bounds temporary memory)
+sos_chunklen = 1 << 18
+
+
+# Get coefficient array from sections
+def sos_coeffs(sections):
+    return numpy.array([(sos.a1, sos.a2, sos.b0, sos.b1, sos.b2)
+                        for sos in sections],
+                       dtype=numpy.float64)
+
+
+# Feedback part with SciPy for (channels, samples) x, returns w
+def allpole_scipy(x, a1, a2, w1, w2):
+    zi = numpy.stack((a1 * w1 + a2 * w2, a2 * w1), axis=-1)
+    w, zf = scipy.signal.lfilter([1.0], [1.0, -a1, -a2], x, axis=-1, zi=zi)
+    return w
+
+
+# Feedback part with NumPy block state-space formulation, returns w
+def allpole_numpy(x, a1, a2, w1, w2, blocklen=None):
+    if blocklen == None:
+        blocklen = sos_blocklen
+    if blocklen < 2:
+        raise ValueError("Block length must be at least 2")
+    channels, count = x.shape
+    blocks = -(-count // blocklen)
+
+    # Impulse response h and responses g to unit initial w1 and w2
+    resp = numpy.zeros((blocklen, 3))
+    prev1, prev2 = numpy.array([0.0, 1.0, 0.0]), numpy.array([0.0, 0.0, 1.0])
+    for i in range(blocklen):
+        resp[i] = a1 * prev1 + a2 * prev2
+        if i == 0:
+            resp[i, 0] += 1.0
+        prev1, prev2 = resp[i], prev1
+    h, g = resp[:, 0], resp[:, 1:]
+
+    # Zero-state responses of all blocks
+    index = numpy.arange(blocklen)
+    lag = index[:, numpy.newaxis] - index[numpy.newaxis, :]
+    toeplitz = numpy.where(lag >= 0, h[numpy.maximum(lag, 0)], 0.0)
+    xb = numpy.zeros((channels, blocks * blocklen))
+    xb[:, :count] = x
+    w = xb.reshape(-1, blocklen).dot(toeplitz.T)
+    w = w.reshape(channels, blocks, blocklen)
+
+    # State (w1, w2) before every block: s[k+1] = M s[k] + u[k]
+    m = g[[blocklen - 1, blocklen - 2]]
+    states = numpy.empty((channels, blocks, 2))
+    states[:, 0, 0], states[:, 0, 1] = w1, w2
+    states[:, 1:] = w[:, :-1, [blocklen - 1, blocklen - 2]]
+
+    # Inclusive scan, after it states[k] = sum M**(k-j) u[j-1]
+    power, step = m, 1
+    while step < blocks:
+        states[:, step:] = states[:, step:] + states[:, :-step].dot(power.T)
+        power = power.dot(power)
+        step *= 2
+
+    w += states.reshape(-1, 2).dot(g.T).reshape(w.shape)
+    return w.reshape(channels, -1)[:, :count]
+
+
+# Feedback engines by name
+allpole_backends = {"scipy": allpole_scipy, "numpy": allpole_numpy}
+
+
+# Filter signal through sections, returns (y, zf). x can have leading
+# channel axes, (..., samples), with zi and zf shaped (..., sections, 2).
+def sosfilt(coeffs, x, zi=None, backend=None):
+    if numpy is None:
+        raise ImportError("sosfilt requires numpy")
+    if backend == None:
+        backend = "scipy" if scipy is not None else "numpy"
+    allpole = allpole_backends[backend]
+
+    coeffs = numpy.asarray(coeffs, dtype=numpy.float64).reshape(-1, 5)
+    y = numpy.array(x, dtype=numpy.float64)
+    shape = y.shape
+    channels = int(numpy.prod(shape[:-1]))
+    y = y.reshape(channels, shape[-1])
+
+    if zi is None:
+        zf = numpy.zeros((channels, len(coeffs), 2))
+    else:
+        zf = numpy.array(zi, dtype=numpy.float64)
+        zf = numpy.broadcast_to(zf, shape[:-1] + (len(coeffs), 2))
+        zf = zf.reshape(channels, len(coeffs), 2).copy()
+
+    for start in range(0, shape[-1], sos_chunklen):
+        chunk = y[:, start:start + sos_chunklen]
+
+        for i, (a1, a2, b0, b1, b2) in enumerate(coeffs):
+            w1, w2 = zf[:, i, 0], zf[:, i, 1]
+
+            # Feedback, then forward part over w with state prepended
+            w = numpy.empty((channels, chunk.shape[1] + 2))
+            w[:, 0], w[:, 1] = w2, w1
+            w[:, 2:] = allpole(chunk, a1, a2, w1, w2)
+            chunk[...] = b0 * w[:, 2:] + b1 * w[:, 1:-1] + b2 * w[:, :-2]
+
+            zf[:, i, 0], zf[:, i, 1] = w[:, -1], w[:, -2]
+
+    return y.reshape(shape), zf.reshape(shape[:-1] + (len(coeffs), 2))
+
+
+# Multichannel cascade, coefficients shared by all channels
+class MultiChannelCascade:
+    # Constructor
+    def __init__(self, sections_, channels_):
+        self.coeffs = sos_coeffs(sections_)
+        self.channels = channels_
+        self.state = numpy.zeros((channels_, len(sections_), 2))
+        return
+
+    # Clear filter state
+    def reset(self):
+        self.state[...] = 0.0
+        return
+
+    # Filter (channels, samples) block, returns filtered block
+    def filter(self, block, backend=None):
+        block = numpy.asarray(block)
+        if block.ndim != 2 or block.shape[0] != self.channels:
+            raise ValueError("Block must be (channels, samples) array")
+
+        out, self.state = sosfilt(self.coeffs, block, self.state, backend)
+        return out
+
+
+#------------------------------------------------------------------------------
+# Fixed-point SOS filtering
+#
+# Same structure as the integer mode of SecondOrderSection, but every
+# product is scaled with an arithmetic shift instead of a division, state
+# and outputs can be saturated to the data word length (wordbits), and
+# overflows are counted per section. Coefficients are Q(bits - 1).
+#
+# With "floor" rounding the results are bit-exact with the integer mode of
+# Cascade as long as nothing saturates: either saturation is off or the
+# word is wide enough (32 bits covers the test tones of main).
+#
+# The recursive part runs sample by sample: with Python integers for a
+# single channel and over int64 channel vectors otherwise. The forward part
+# is vectorized over the whole block.
+#------------------------------------------------------------------------------
+
+# Fixed-point rounding modes: "floor" just shifts, "nearest" adds half first
+fixed_rounding_modes = ["floor", "nearest"]
+
+
+# Fixed-point cascade, coefficients shared by all channels
+class FixedCascade:
+    # Constructor
+    def __init__(self,
+                 sections_,
+                 bits_=16,
+                 wordbits_=32,
+                 rounding_="floor",
+                 saturation_=True,
+                 channels_=1):
+        if numpy is None:
+            raise ImportError("FixedCascade requires numpy")
+        if rounding_ not in fixed_rounding_modes:
+            raise ValueError("Unknown rounding: %s" % rounding_)
+        if bits_ < 2 or bits_ > 32 or wordbits_ < 2 or wordbits_ > 32:
+            raise ValueError("Word length must be 2..32 bits")
+
+        self.coeffs = numpy.array([(sos.a1, sos.a2, sos.b0, sos.b1, sos.b2)
+                                   for sos in sections_],
+                                  dtype=numpy.int64)
+        self.bits = bits_
+        self.wordbits = wordbits_
+        self.rounding = rounding_
+        self.saturation = saturation_
+        self.channels = channels_
+        self.low = -(1 << (wordbits_ - 1))
+        self.high = (1 << (wordbits_ - 1)) - 1
+        self.state = numpy.zeros((channels_, len(self.coeffs), 2),
+                                 dtype=numpy.int64)
+        self.reset_counters()
+        return
+
+    # Clear filter state
+    def reset(self):
+        self.state[...] = 0
+        return
+
+    # Clear overflow counters
+    def reset_counters(self):
+        self.input_overflows = 0
+        self.overflows = numpy.zeros(len(self.coeffs), dtype=numpy.int64)
+        return
+
+    # Count values outside the word, saturate them if enabled
+    def saturate(self, x):
+        count = numpy.count_nonzero((x < self.low) | (x > self.high))
+        if count and self.saturation:
+            numpy.clip(x, self.low, self.high, out=x)
+        return count
+
+    # Feedback part of one channel with Python integers, w[0:2] holds the
+    # state (w2, w1) and w[2:] is filled. Returns overflow count.
+    def allpole_int(self, x, w, a1, a2, half):
+        shift, low, high = self.bits - 1, self.low, self.high
+        saturation = self.saturation
+        w2, w1 = int(w[0]), int(w[1])
+        out = x.tolist()
+        count = 0
+
+        for i in range(len(out)):
+            w0 = out[i] + ((a1 * w1 + half) >> shift) + \
+             ((a2 * w2 + half) >> shift)
+            if w0 > high or w0 < low:
+                count += 1
+                if saturation:
+                    w0 = min(max(w0, low), high)
+            out[i] = w0
+            w1, w2 = w0, w1
+
+        w[2:] = out
+        return count
+
+    # Feedback part over int64 channel vectors, see allpole_int
+    def allpole_array(self, x, w, a1, a2, half):
+        shift = self.bits - 1
+        count = 0
+
+        for i in range(x.shape[1]):
+            w0 = x[:, i] + ((a1 * w[:, i + 1] + half) >> shift) + \
+             ((a2 * w[:, i] + half) >> shift)
+            count += self.saturate(w0)
+            w[:, i + 2] = w0
+
+        return count
+
+    # Filter integer block, (samples) or (channels, samples), returns int64
+    # block of the same shape
+    def filter(self, block):
+        x = numpy.array(block, dtype=numpy.int64)
+        shape = x.shape
+        x = x.reshape(-1, shape[-1])
+        if x.shape[0] != self.channels:
+            raise ValueError("Block does not match channel count")
+
+        self.input_overflows += self.saturate(x)
+
+        shift = self.bits - 1
+        half = 0
+        if self.rounding == "nearest":
+            half = 1 << (shift - 1)
+
+        for i, (a1, a2, b0, b1, b2) in enumerate(self.coeffs.tolist()):
+            w = numpy.empty((self.channels, x.shape[1] + 2),
+                            dtype=numpy.int64)
+            w[:, 0], w[:, 1] = self.state[:, i, 1], self.state[:, i, 0]
+
+            # Feedback
+            if self.channels == 1:
+                count = self.allpole_int(x[0], w[0], a1, a2, half)
+            else:
+                count = self.allpole_array(x, w, a1, a2, half)
+
+            # Forward
+            x = ((b0 * w[:, 2:] + half) >> shift) + \
+             ((b1 * w[:, 1:-1] + half) >> shift) + \
+             ((b2 * w[:, :-2] + half) >> shift)
+            count += self.saturate(x)
+
+            self.overflows[i] += count
+            self.state[:, i, 0], self.state[:, i, 1] = w[:, -1], w[:, -2]
+
+        return x.reshape(shape)
+
+
+#------------------------------------------------------------------------------
+# Analytic frequency response
+#
+# With z = exp(-jw) every section is
+#
+#	H(w) = (b0 + b1 z + b2 z^2) / (1 - a1 z - a2 z^2)
+#
+# and the cascade response is the product over sections. Group delay of a
+# polynomial P(w) = sum p[k] z^k is Re(sum k p[k] z^k / P(w)) samples, and
+# the delays of numerators and denominators simply add up.
+#------------------------------------------------------------------------------
+
+
+# Frequency response of a cascade
+class FrequencyResponse:
+    # Constructor
+    def __init__(self, freqs_, response_, delay_):
+        self.freqs = freqs_
+        self.response = response_
+        self.delay = delay_
+        self.magnitude = 20.0 * numpy.log10(
+            numpy.maximum(numpy.abs(response_), 1e-300))
+        self.phase = numpy.unwrap(numpy.angle(response_))
+        return
+
+
+# Polynomial sum p[k] z^k and its group delay at every z
+def poly_response(poly, z):
+    value = poly[0] + poly[1] * z + poly[2] * z * z
+    ramp = poly[1] * z + 2.0 * poly[2] * z * z
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        delay = numpy.real(ramp / value)
+    return value, delay
+
+
+# Evaluate response of sections at freqs (Hz). Integer mode coefficients
+# (bits given) are scaled down by 2**(bits - 1), gain scales the magnitude
+# like the incoming sample scaling does.
+def frequency_response(sections, freqs, rate, bits=None, gain=1.0):
+    if numpy is None:
+        raise ImportError("frequency_response requires numpy")
+
+    coeffs = numpy.asarray(sos_coeffs(sections)
+                           if hasattr(sections[0], "a1") else sections,
+                           dtype=numpy.float64).reshape(-1, 5)
+    if bits != None:
+        coeffs = coeffs / 2**(bits - 1)
+
+    freqs = numpy.asarray(freqs, dtype=numpy.float64)
+    z = numpy.exp(-2j * math.pi * freqs / rate)
+    response = numpy.full(freqs.shape, complex(gain))
+    delay = numpy.zeros(freqs.shape)
+
+    for a1, a2, b0, b1, b2 in coeffs:
+        num, numdelay = poly_response((b0, b1, b2), z)
+        den, dendelay = poly_response((1.0, -a1, -a2), z)
+        response *= num / den
+        delay += numdelay - dendelay
+
+    return FrequencyResponse(freqs, response, delay)
+
+
 # Sine generator
 class SineGenerator:
     # Constructor
@@ -87,6 +514,15 @@ class SineGenerator:
         sample = math.sin(self.angle)
         return sample
 
+    # Generate block of count samples (NumPy array) continuing the phase of
+    # generate. The angle is kept wrapped to [0, 2pi).
+    def generate_block(self, freq, count):
+        anglechange = 2.0 * math.pi * (
+            float(freq.freq) / float(self.samplerate))
+        angles = self.angle + anglechange * numpy.arange(1, count + 1)
+        self.angle = math.fmod(self.angle + anglechange * count, 2.0 * math.pi)
+        return numpy.sin(angles)
+
 
 #------------------------------------------------------------------------------
 # Data tables and general settings
@@ -119,6 +555,10 @@ intsections = [
     SecondOrderSection(59074, -30951, 480, -811, 480)
 ]
 
+# Section cascades
+cascade = Cascade(sections)
+intcascade = Cascade(intsections, bits)
+
 # Create sine generator
 sinegen = SineGenerator(samplerate)
 
@@ -127,33 +567,73 @@ sinegen = SineGenerator(samplerate)
 #------------------------------------------------------------------------------
 
 
-# Main function
+# Print analytic response at test frequencies
+def print_response(title, response):
+    print "-----------------------------------------------------------------"
+    print title
+    print "-----------------------------------------------------------------"
+    for freq, magnitude, phase, delay in zip(
+            response.freqs, response.magnitude, response.phase,
+            response.delay):
+        print 'Freq: %4d, Atten: %-5.1f dB, Phase: %7.1f deg, Delay: %5.2f' % \
+         (freq, magnitude, math.degrees(phase), delay)
+    return
+
+
+# Analytic float and fixed point responses
+def analytic():
+    freqs = [freq.freq for freq in freqtable]
+    response = frequency_response(sections, freqs, samplerate, None, prescale)
+    print_response("                 Floating point response", response)
+    response = frequency_response(intsections, freqs, samplerate, bits,
+                                  prescale)
+    print_response("                   Fixed point response", response)
+    return
+
+
+# Filter WAV file through the float sections (all channels), input is
+# prescaled like the test tones
+def filter_wav(infile, outfile, blocklen=wavio.default_chunksize):
+    source = wavio.WavSource(infile)
+    mcc = MultiChannelCascade(sections, source.channels)
+    waveout = wavio.WavSink(outfile, source.samplerate, source.channels)
+
+    for block in source.int_blocks(blocklen):
+        out = mcc.filter(block.T * (prescale / 2**(bits - 1)))
+        waveout.write(out.T)
+
+    waveout.close()
+    return waveout.clipped
+
+
+# Main function (--analytic skips the sine sweep, --filter <in> <out>
+# filters a WAV file)
 def main():
 
+    if "--analytic" in sys.argv[1:]:
+        analytic()
+        return
+
+    if len(sys.argv) > 3 and sys.argv[1] == "--filter":
+        clipped = filter_wav(sys.argv[2], sys.argv[3])
+        print "Wrote file %s (%i samples clipped)" % (sys.argv[3], clipped)
+        return
+
     # ---------- Floating point -------------
 
-    waveout = wave.open("float.wav", "w")
-    waveout.setnchannels(1)
-    waveout.setsampwidth(2)
-    waveout.setframerate(samplerate)
-    waveout.setcomptype("NONE", "Uncompressed")
-    sbuf = array.array('h')
+    waveout = wavio.WavSink("float.wav", samplerate)
 
     # Test all frequency bands (float)
     for freq in freqtable:
 
         # Run scount samples with same frequence through filter
-        for i in range(scount):
-            sample = prescale * sinegen.generate(freq)
-
-            # Run sample through filter sections
-            for sos in sections:
-                sample = sos.filter(sample)
+        block = [prescale * sinegen.generate(freq) for i in range(scount)]
 
+        out = cascade.filter(block)
+        for sample in out:
             freq.collect(sample)
-            sbuf.append(int(sample * (2**(bits - 1))))
+        waveout.write(out)
 
-    waveout.writeframes(sbuf.tostring())
     waveout.close()
 
     # Print float results
@@ -165,29 +645,22 @@ def main():
          (freq.freq, freq.maxval, 20 * math.log10( freq.maxval ) )
 
     # ---------- Fixed point -------------
-    waveout = wave.open("integer.wav", "w")
-    waveout.setnchannels(1)
-    waveout.setsampwidth(2)
-    waveout.setframerate(samplerate)
-    waveout.setcomptype("NONE", "Uncompressed")
-    sbuf = array.array('h')
+    waveout = wavio.WavSink("integer.wav", samplerate)
 
     # Test all frequency bands (integer)
     for freq in freqtable:
 
         # Run scount samples with same frequence through filter
-        for i in range(scount):
-            sample = prescale * sinegen.generate(freq)
-            sample = int(sample * (2**(bits - 1)))
-
-            # Run sample through filter sections
-            for sos in intsections:
-                sample = sos.filter(sample, bits)
+        block = [
+            int(prescale * sinegen.generate(freq) * (2**(bits - 1)))
+            for i in range(scount)
+        ]
 
+        out = intcascade.filter(block)
+        for sample in out:
             freq.collect(sample)
-            sbuf.append(sample)
+        waveout.write_int(out)
 
-    waveout.writeframes(sbuf.tostring())
     waveout.close()
 
     # Print int results
@@ -198,6 +671,10 @@ def main():
         print 'Freq: %4d, Maxvalue: %8d, Atten: %2.1f dB' % \
          (freq.freq, freq.maxval, 20 * math.log10( float( freq.maxval ) / 32768.0 ) )
 
+    # Sweep results should agree with the analytic response
+    if numpy is not None:
+        analytic()
+
     return
 
 
@@ -0,0 +1,149 @@
+#------------------------------------------------------------------------------
+# Parallel IIR verification sweep.
+#
+# Every (coefficient set, mode, frequency) tone test of iir.py is an
+# independent job, so jobs are sharded across a process pool and the
+# measured maximum values are gathered into float vs fixed point tables.
+#------------------------------------------------------------------------------
+
+import sys
+import math
+import multiprocessing
+
+import iir
+
+#------------------------------------------------------------------------------
+# Class definitions
+#------------------------------------------------------------------------------
+
+
+# Coefficient set: float and fixed point sections of one filter design
+class CoefficientSet:
+    # Constructor
+    def __init__(self, name_, sections_, intsections_, bits_, prescale_):
+        self.name = name_
+        self.sections = [(sos.a1, sos.a2, sos.b0, sos.b1, sos.b2)
+                         for sos in sections_]
+        self.intsections = [(sos.a1, sos.a2, sos.b0, sos.b1, sos.b2)
+                            for sos in intsections_]
+        self.bits = bits_
+        self.prescale = prescale_
+        return
+
+    # Build fresh cascade for mode ("float" or "fixed")
+    def cascade(self, mode):
+        if mode == "float":
+            return iir.Cascade(
+                [iir.SecondOrderSection(*c) for c in self.sections])
+        return iir.Cascade(
+            [iir.SecondOrderSection(*c) for c in self.intsections], self.bits)
+
+
+# Result of one tone test
+class SweepResult:
+    # Constructor
+    def __init__(self, name_, mode_, freq_, maxval_, atten_):
+        self.name = name_
+        self.mode = mode_
+        self.freq = freq_
+        self.maxval = maxval_
+        self.atten = atten_
+        return
+
+
+#------------------------------------------------------------------------------
+# Sweep functions
+#------------------------------------------------------------------------------
+
+# Filter modes
+modes = ["float", "fixed"]
+
+# Jobs handed to a worker at a time
+job_chunksize = 4
+
+
+# Run one tone test, job is (coefficient set, mode, frequency)
+def run_job(job):
+    coeffset, mode, freq = job
+    test = iir.Freq(freq)
+    sinegen = iir.SineGenerator(iir.samplerate)
+    scale = 2**(coeffset.bits - 1)
+
+    block = coeffset.prescale * sinegen.generate_block(test, iir.scount)
+    if mode == "fixed":
+        block = (block * scale).astype(int)
+
+    for sample in coeffset.cascade(mode).filter(block):
+        test.collect(sample)
+
+    # Fixed point results are relative to full scale
+    level = float(test.maxval)
+    if mode == "fixed":
+        level = level / scale
+    atten = 20 * math.log10(max(level, 1e-300))
+    return SweepResult(coeffset.name, mode, freq, test.maxval, atten)
+
+
+# Run all jobs in a process pool, returns {(name, mode, freq): result}
+def sweep(coeffsets, freqs, processes=None):
+    jobs = [(coeffset, mode, freq)
+            for coeffset in coeffsets
+            for mode in modes
+            for freq in freqs]
+
+    results = {}
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(run_job, jobs, job_chunksize):
+            results[(result.name, result.mode, result.freq)] = result
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+# Print float vs fixed point table of one coefficient set
+def print_comparison(coeffset, freqs, results):
+    print "-----------------------------------------------------------------"
+    print "   Float vs fixed point: %s" % coeffset.name
+    print "-----------------------------------------------------------------"
+    for freq in freqs:
+        fl = results[(coeffset.name, "float", freq)]
+        fx = results[(coeffset.name, "fixed", freq)]
+        print 'Freq: %4d, Float: %-5.1f dB, Fixed: %-5.1f dB, Error: %5.2f dB' % \
+         (freq, fl.atten, fx.atten, fx.atten - fl.atten)
+    return
+
+
+#------------------------------------------------------------------------------
+# Data tables and general settings
+#------------------------------------------------------------------------------
+
+# Coefficient sets to verify
+coeffsets = [
+    CoefficientSet("iir.py", iir.sections, iir.intsections, iir.bits,
+                   iir.prescale)
+]
+
+#------------------------------------------------------------------------------
+# Main functions
+#------------------------------------------------------------------------------
+
+
+# Main function
+def main():
+    processes = None
+    if len(sys.argv) > 1:
+        processes = int(sys.argv[1])
+
+    freqs = [freq.freq for freq in iir.freqtable]
+    results = sweep(coeffsets, freqs, processes)
+
+    for coeffset in coeffsets:
+        print_comparison(coeffset, freqs, results)
+
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#------------------------------------------------------------------------------
+# Tests of the design cache of design.py
+#
+# Run with: python -m unittest discover -s iir
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+import numpy
+
+try:
+    import design
+except ImportError:
+    design = None
+
+# Design parameters: (Fs, Fstart, Fend, Rpass, Rstop, order, bits)
+variants = [(16000.0, 3400.0 + 10 * i, 0.0, 0.5, 60.0, 8, 16)
+            for i in range(12)]
+
+
+# Design a variant into a cache file, job is (filename, variant)
+def design_job(job):
+    filename, variant = job
+    design.design_caches.pop(filename, None)
+    return design.design(*(variant + (filename, )))[0]
+
+
+@unittest.skipIf(design is None, "design.py requires SciPy")
+class DesignCacheTest(unittest.TestCase):
+    """Design cache shared by processes"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "designs.jsonl")
+        return
+
+    def tearDown(self):
+        design.design_caches.pop(self.filename, None)
+        shutil.rmtree(self.directory)
+        return
+
+    def test_parallel_designs_are_kept(self):
+        pool = multiprocessing.Pool(4)
+        try:
+            pool.map(design_job, [(self.filename, v) for v in variants])
+        finally:
+            pool.close()
+            pool.join()
+
+        cache = design.read_cache(self.filename)
+        self.assertEqual(sorted(cache),
+                         sorted([design.design_key(*v) for v in variants]))
+        return
+
+    def test_cached_design_is_reused(self):
+        first = design.design(*(variants[0] + (self.filename, )))
+        design.design_caches.pop(self.filename)
+        second = design.design(*(variants[0] + (self.filename, )))
+        self.assertEqual(first[0], second[0])
+        numpy.testing.assert_array_equal(first[2], second[2])
+
+        with open(self.filename) as cachefile:
+            self.assertEqual(len(cachefile.readlines()), 1)
+        return
+
+    def test_line_cut_short_is_skipped(self):
+        design.design(*(variants[0] + (self.filename, )))
+        with open(self.filename, "a") as cachefile:
+            cachefile.write('{"key": "cut')
+
+        design.design_caches.pop(self.filename)
+        design.design(*(variants[1] + (self.filename, )))
+        cache = design.read_cache(self.filename)
+        self.assertEqual(sorted(cache),
+                         sorted([design.design_key(*v) for v in variants[:2]]))
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
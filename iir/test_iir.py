@@ -0,0 +1,279 @@
+#------------------------------------------------------------------------------
+# Tests of the block filters of iir.py
+#
+# Run with: python -m unittest discover -s iir
+#------------------------------------------------------------------------------
+
+import random
+import unittest
+
+import numpy
+
+import iir
+
+try:
+    import scipy.signal
+except ImportError:
+    scipy = None
+
+
+# Fresh copies of the coefficient tables (sections carry filter state)
+def make_sections(table):
+    return [iir.SecondOrderSection(sos.a1, sos.a2, sos.b0, sos.b1, sos.b2)
+            for sos in table]
+
+
+# Filter samples one at a time through the sections
+def filter_samples(sections, samples, bits=None):
+    out = []
+    for sample in samples:
+        for sos in sections:
+            sample = sos.filter(sample, bits)
+        out.append(sample)
+    return out
+
+
+# Split samples into blocks of random lengths (including empty blocks)
+def random_blocks(rand, samples):
+    blocks, pos = [], 0
+    while pos < len(samples):
+        count = rand.randint(0, 300)
+        blocks.append(samples[pos:pos + count])
+        pos += count
+    return blocks
+
+
+class CascadeTest(unittest.TestCase):
+    """Block filtering of Cascade against SecondOrderSection.filter"""
+
+    def setUp(self):
+        self.rand = random.Random(11)
+        self.samples = [self.rand.uniform(-1.0, 1.0) for i in range(3000)]
+        self.intsamples = [int(sample * 2**(iir.bits - 1) / iir.prescale)
+                           for sample in self.samples]
+        return
+
+    def test_float_blocks_match_samples(self):
+        expected = filter_samples(make_sections(iir.sections), self.samples)
+        cascade = iir.Cascade(make_sections(iir.sections))
+        out = []
+        for block in random_blocks(self.rand, self.samples):
+            out += cascade.filter(block)
+        self.assertEqual(out, expected)
+        return
+
+    def test_integer_blocks_match_samples(self):
+        expected = filter_samples(make_sections(iir.intsections),
+                                  self.intsamples, iir.bits)
+        cascade = iir.Cascade(make_sections(iir.intsections), iir.bits)
+        out = []
+        for block in random_blocks(self.rand, self.intsamples):
+            out += cascade.filter(block)
+        self.assertEqual(out, expected)
+        return
+
+    def test_numpy_block(self):
+        expected = filter_samples(make_sections(iir.sections), self.samples)
+        cascade = iir.Cascade(make_sections(iir.sections))
+        out = cascade.filter(numpy.array(self.samples[:1000]))
+        out += cascade.filter(numpy.array(self.samples[1000:]))
+        self.assertEqual(out, expected)
+        return
+
+    def test_state_is_carried_in_sections(self):
+        sections = make_sections(iir.sections)
+        iir.Cascade(sections).filter(self.samples[:500])
+
+        # Continuing sample by sample from the same sections
+        expected = filter_samples(make_sections(iir.sections), self.samples)
+        self.assertEqual(filter_samples(sections, self.samples[500:]),
+                         expected[500:])
+        return
+
+
+# Coefficient rows of sections in scipy.signal.sosfilt layout
+def scipy_sos(sections):
+    return numpy.array([(sos.b0, sos.b1, sos.b2, 1.0, -sos.a1, -sos.a2)
+                        for sos in sections])
+
+
+@unittest.skipIf(scipy is None, "SciPy is the reference")
+class SosfiltTest(unittest.TestCase):
+    """sosfilt backends against SciPy and SecondOrderSection.filter"""
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(12)
+        self.rand = random.Random(12)
+        self.coeffs = iir.sos_coeffs(iir.sections)
+        return
+
+    def assert_close(self, actual, expected, message=""):
+        scale = max(numpy.abs(expected).max(), 1.0)
+        numpy.testing.assert_allclose(actual, expected, rtol=0,
+                                      atol=1e-10 * scale, err_msg=message)
+        return
+
+    def test_allpole_numpy_matches_scipy(self):
+        x = self.random.randn(3, 2500)
+        w1, w2 = self.random.randn(3), self.random.randn(3)
+        for a1, a2, b0, b1, b2 in self.coeffs:
+            expected = iir.allpole_scipy(x, a1, a2, w1, w2)
+            for blocklen in [2, 3, 5, 64, 1000, 4096]:
+                self.assert_close(
+                    iir.allpole_numpy(x, a1, a2, w1, w2, blocklen), expected,
+                    "block length %d" % blocklen)
+        return
+
+    def test_allpole_numpy_rejects_short_blocks(self):
+        x = self.random.randn(1, 100)
+        for blocklen in [0, 1]:
+            self.assertRaises(ValueError, iir.allpole_numpy, x, 1.5, -0.7,
+                              numpy.zeros(1), numpy.zeros(1), blocklen)
+        return
+
+    def test_backends_match_samples(self):
+        zi = self.random.randn(len(self.coeffs), 2)
+        samples = self.random.uniform(-1.0, 1.0, 3000)
+
+        # Per-sample reference starting from the same state
+        sections = make_sections(iir.sections)
+        for sos, state in zip(sections, zi):
+            sos.buf = [0.0, state[0], state[1]]
+        expected = numpy.array(filter_samples(sections, samples))
+
+        for backend in iir.allpole_backends:
+            out, state = [], zi
+            for block in random_blocks(self.rand, samples):
+                y, state = iir.sosfilt(self.coeffs, block, state, backend)
+                out.append(y)
+            self.assert_close(numpy.concatenate(out), expected, backend)
+            self.assert_close(state, [sos.buf[1:3] for sos in sections],
+                              backend)
+        return
+
+    def test_longer_than_chunk(self):
+        x = self.random.randn(2, iir.sos_chunklen + 1000)
+        expected = scipy.signal.sosfilt(scipy_sos(iir.sections), x, axis=-1)
+        for backend in iir.allpole_backends:
+            y, zf = iir.sosfilt(self.coeffs, x, None, backend)
+            self.assert_close(y, expected, backend)
+
+            # Continuing from zf equals filtering in one go
+            more = self.random.randn(2, 500)
+            tail, zf = iir.sosfilt(self.coeffs, more, zf, backend)
+            whole = scipy.signal.sosfilt(scipy_sos(iir.sections),
+                                         numpy.concatenate((x, more), 1))
+            self.assert_close(tail, whole[:, -500:], backend)
+        return
+
+    def test_filter_array_matches_filter(self):
+        samples = self.random.uniform(-1.0, 1.0, 2000)
+        expected = iir.Cascade(make_sections(iir.sections)).filter(samples)
+        for backend in iir.allpole_backends:
+            cascade = iir.Cascade(make_sections(iir.sections))
+            out = [cascade.filter_array(samples[:700], backend),
+                   cascade.filter_array(samples[700:], backend)]
+            self.assert_close(numpy.concatenate(out), expected, backend)
+
+        cascade = iir.Cascade(make_sections(iir.intsections), iir.bits)
+        self.assertRaises(ValueError, cascade.filter_array, samples)
+        return
+
+
+class MultiChannelCascadeTest(unittest.TestCase):
+    """MultiChannelCascade against per-channel Cascade"""
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(13)
+        self.rand = random.Random(13)
+        return
+
+    def test_channels_match_cascade(self):
+        block = self.random.uniform(-1.0, 1.0, (4, 3000))
+        for backend in iir.allpole_backends:
+            multi = iir.MultiChannelCascade(iir.sections, 4)
+            out = [multi.filter(piece.T, backend)
+                   for piece in random_blocks(self.rand, block.T)]
+            out = numpy.concatenate(out, axis=1)
+
+            for channel in range(4):
+                cascade = iir.Cascade(make_sections(iir.sections))
+                numpy.testing.assert_allclose(
+                    out[channel], cascade.filter(block[channel]), rtol=0,
+                    atol=1e-10, err_msg="%s channel %d" % (backend, channel))
+        return
+
+    def test_reset_and_shape(self):
+        block = self.random.uniform(-1.0, 1.0, (2, 500))
+        multi = iir.MultiChannelCascade(iir.sections, 2)
+        first = multi.filter(block)
+        multi.reset()
+        numpy.testing.assert_array_equal(multi.filter(block), first)
+
+        self.assertRaises(ValueError, multi.filter, block[0])
+        self.assertRaises(ValueError, multi.filter, numpy.zeros((3, 10)))
+        return
+
+
+class FixedCascadeTest(unittest.TestCase):
+    """FixedCascade against the integer mode of Cascade"""
+
+    def setUp(self):
+        self.rand = random.Random(17)
+
+        # Test tones of main, prescaled to 16-bit full scale
+        sinegen = iir.SineGenerator(iir.samplerate)
+        scale = 2**(iir.bits - 1)
+        self.tones = []
+        for freq in [100, 1000, 2000, 3500, 4900]:
+            block = iir.prescale * sinegen.generate_block(
+                iir.Freq(freq), 1000)
+            self.tones += (block * scale).astype(int).tolist()
+        return
+
+    def cascade_output(self, samples):
+        cascade = iir.Cascade(make_sections(iir.intsections), iir.bits)
+        return cascade.filter(samples)
+
+    def test_floor_32_bit_is_bit_exact(self):
+        fixed = iir.FixedCascade(iir.intsections, iir.bits, 32, "floor")
+        out = []
+        for block in random_blocks(self.rand, self.tones):
+            out += fixed.filter(block).tolist()
+        self.assertEqual(out, self.cascade_output(self.tones))
+        self.assertEqual(fixed.overflows.sum(), 0)
+        self.assertEqual(fixed.input_overflows, 0)
+        return
+
+    def test_no_saturation_is_bit_exact(self):
+        # Overflows of a narrow word are only counted
+        fixed = iir.FixedCascade(iir.intsections, iir.bits, 16, "floor",
+                                 False)
+        out = fixed.filter(self.tones)
+        self.assertEqual(out.tolist(), self.cascade_output(self.tones))
+        self.assertTrue(fixed.overflows.sum() > 0)
+        return
+
+    def test_saturation_limits_word(self):
+        fixed = iir.FixedCascade(iir.intsections, iir.bits, 16)
+        out = fixed.filter(self.tones)
+        self.assertTrue(out.max() <= 2**15 - 1 and out.min() >= -2**15)
+        self.assertTrue(fixed.overflows.sum() > 0)
+        return
+
+    def test_channels_match_mono(self):
+        block = numpy.array(self.tones[:4500]).reshape(3, -1)
+        for rounding in iir.fixed_rounding_modes:
+            multi = iir.FixedCascade(iir.intsections, iir.bits, 18, rounding,
+                                     True, 3)
+            out = multi.filter(block)
+            for channel in range(3):
+                mono = iir.FixedCascade(iir.intsections, iir.bits, 18,
+                                        rounding)
+                self.assertEqual(out[channel].tolist(),
+                                 mono.filter(block[channel]).tolist())
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+
+import sys
+import time
+import collections
+import numpy
+
+import fft
+
+#-------------------------------------------------------------------------------
+# Overlap-save fast convolution on top of the FFT in fft.py
+#
+# A FIR kernel of M taps is applied to L sample blocks with one real FFT and
+# one inverse real FFT of size N >= L + M - 1 per block, instead of M
+# multiplies per output sample.
+#-------------------------------------------------------------------------------
+
+# Maximum number of cached kernel spectra
+kernel_cache_size = 16
+
+# Kernel spectrum cache, least recently used first
+kernel_cache = collections.OrderedDict()
+
+
+#
+# Get FFT size for block and kernel
+#
+def fft_size(blocksize, taps):
+    """
+		Smallest power of two that fits a block and the kernel history
+		@param blocksize:	output samples per block
+		@param taps:		kernel length
+		@return:			FFT size
+	"""
+    size = 2
+    while size < blocksize + taps - 1:
+        size <<= 1
+    return size
+
+
+#
+# Get kernel spectrum from cache
+#
+def kernel_spectrum(kernel, size, engine="numpy"):
+    """
+		Real FFT of zero padded kernel, cached by kernel contents
+		@param kernel:		float64 kernel array
+		@param size:		FFT size
+		@param engine:		FFT engine
+		@return:			size/2+1 bin spectrum
+	"""
+    key = (size, engine, kernel.tobytes())
+    try:
+        spectrum = kernel_cache.pop(key)
+    except KeyError:
+        padded = numpy.zeros(size)
+        padded[:len(kernel)] = kernel
+        spectrum = numpy.asarray(fft.rfft(None, padded, engine))
+        while len(kernel_cache) >= max(kernel_cache_size, 1):
+            kernel_cache.popitem(last=False)
+
+    kernel_cache[key] = spectrum
+    return spectrum
+
+
+#-------------------------------------------------------------------------------
+# Overlap-save filter
+#-------------------------------------------------------------------------------
+class OverlapSave:
+    # Constructor
+    def __init__(self, kernel, blocksize=None, engine="numpy"):
+        self.kernel = numpy.array(kernel, dtype=numpy.float64).ravel()
+        if not len(self.kernel):
+            raise ValueError("Empty kernel")
+
+        # Default block is as long as the kernel
+        if blocksize is None:
+            blocksize = len(self.kernel)
+
+        self.blocksize = blocksize
+        self.size = fft_size(blocksize, len(self.kernel))
+        self.plan = fft.rfft_plan(self.size, engine)
+        self.spectrum = kernel_spectrum(self.kernel, self.size, engine)
+        self.history = numpy.zeros(self.size)
+        return
+
+    # Forget filter history
+    def reset(self):
+        self.history[:] = 0.0
+        return
+
+    # Filter one block (len(block) == blocksize), returns blocksize samples
+    def filter(self, block):
+        block = numpy.asarray(block, dtype=numpy.float64)
+        if block.shape != (self.blocksize, ):
+            raise ValueError("Invalid incoming data blocksize")
+
+        # Slide the input window by one block
+        size, count = self.size, self.blocksize
+        self.history[:size - count] = self.history[count:]
+        self.history[size - count:] = block
+
+        # Circular convolution, the last block is free of wrap-around
+        spectrum = numpy.asarray(self.plan.execute(None, self.history))
+        spectrum *= self.spectrum
+        out = self.plan.execute_inverse(None, spectrum)
+        return numpy.array(out[size - count:])
+
+
+#
+# Convolve whole signal
+#
+def convolve(signal, kernel, blocksize=None, engine="numpy"):
+    """
+		Full linear convolution through OverlapSave
+		@param signal:		input samples
+		@param kernel:		FIR kernel
+		@param blocksize:	samples per block (kernel length if None)
+		@param engine:		FFT engine
+		@return:			len(signal) + len(kernel) - 1 samples
+	"""
+    ols = OverlapSave(kernel, blocksize, engine)
+    count = len(signal) + len(ols.kernel) - 1
+
+    padded = numpy.zeros(-(-count // ols.blocksize) * ols.blocksize)
+    padded[:len(signal)] = signal
+
+    out = [
+        ols.filter(padded[start:start + ols.blocksize])
+        for start in range(0, len(padded), ols.blocksize)
+    ]
+    return numpy.concatenate(out)[:count]
+
+
+#
+# Main function
+#
+def main():
+    """
+		Main method
+	"""
+    taps = 4096
+    blocksize = 1024
+    samplerate = 16000
+    if len(sys.argv) > 1:
+        taps = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        blocksize = int(sys.argv[2])
+
+    print "Overlap-save convolution"
+    print "Usage: python convolve.py <taps> <blocksize>"
+    print ""
+
+    kernel = numpy.random.randn(taps) / taps
+    ols = OverlapSave(kernel, blocksize)
+    print "Taps: %i, Blocksize: %i, FFT size: %i" % (taps, blocksize,
+                                                     ols.size)
+
+    # Filter one second of noise
+    blocks = samplerate // blocksize + 1
+    signal = numpy.random.randn(blocks * blocksize)
+    start = time.time()
+    for i in range(blocks):
+        ols.filter(signal[i * blocksize:(i + 1) * blocksize])
+    elapsed = time.time() - start
+
+    print "Filtered %i samples in %.3f s (%.1fx real time at %i Hz)" % \
+     (len(signal), elapsed, len(signal) / (elapsed * samplerate), samplerate)
+    return
+
+
+if __name__ == "__main__":
+    main()
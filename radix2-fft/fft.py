@@ -2,11 +2,23 @@
 
 import sys
 import math
+import timeit
+import collections
+
+# NumPy is needed only by the vectorized engine
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 #-------------------------------------------------------------------------------
 # This file contains Decimation-In-Frequency implementation of Radix-2 FFT
 # 19.9.2004 Harri Salokorpi <harri.salokorpi@iki.fi>
 #
+# Lengths that are not powers of two use mixed radix (4, 2, 3, 5) DIF when
+# the length has no other prime factors, and Bluestein's chirp-z algorithm
+# on top of the radix-2 FFT otherwise.
+#
 # List comprehension explained:
 # 	http://docs.python.org/tut/node7.html#SECTION007140000000000000000
 #-------------------------------------------------------------------------------
@@ -14,6 +26,12 @@ import math
 # Default FFT length
 default_fft_len = 8
 
+# Maximum number of cached FFT plans
+fft_plan_cache_size = 32
+
+# Default transform engine ("python" or "numpy")
+default_fft_engine = "python"
+
 
 #-------------------------------------------------------------------------------
 # Progress printing
@@ -21,6 +39,10 @@ default_fft_len = 8
 class progress:
     """Progress listener class"""
 
+    # Report every n:th butterfly of a stage. Zero disables group and
+    # butterfly callbacks, which lets the transform use its fast path.
+    butterfly_interval = 1
+
     # FFT start format string
     fft_start_format = ["Length: %(length)i => Stages: %(stage)i"]
 
@@ -107,6 +129,72 @@ class progress:
         return
 
 
+class null_progress(progress):
+    """Progress listener that ignores everything"""
+
+    butterfly_interval = 0
+
+    def fft_start(self, length, stages):
+        return
+
+    def fft_end(self, length, stages):
+        return
+
+    def stage_start(self, stage, groupcount, groupsize):
+        return
+
+    def stage_end(self, stage, groupcount):
+        return
+
+    def group_start(self, stage, group, bflycount):
+        return
+
+    def butterfly_start(self, stage, group, butterfly, a, b, k, i1, i2):
+        return
+
+    def butterfly_info(self, stage, group, butterfly, a, b, x, y):
+        return
+
+
+class sampled_progress(progress):
+    """Progress listener that prints only every n:th butterfly"""
+
+    # Constructor
+    def __init__(self, interval):
+        self.butterfly_interval = interval
+        return
+
+
+class timing_progress(null_progress):
+    """Progress listener that collects stage durations"""
+
+    # Constructor
+    def __init__(self):
+        self.stage_times = []
+        self.started = 0.0
+        return
+
+    # FFT started, forget previous timings
+    def fft_start(self, length, stages):
+        self.stage_times = []
+        return
+
+    # Stage started
+    def stage_start(self, stage, groupcount, groupsize):
+        self.started = timeit.default_timer()
+        return
+
+    # Stage ended, store (stage, elapsed ns)
+    def stage_end(self, stage, groupcount):
+        elapsed = timeit.default_timer() - self.started
+        self.stage_times.append((stage, int(elapsed * 1e9)))
+        return
+
+
+# Listener used when None is given as progress
+quiet = null_progress()
+
+
 def complex2string(c):
     """Converts complex number to nicely formatted string"""
     return "(%(real).2f, j%(complex).2f)" % {"real": c.real, "complex": c.imag}
@@ -136,23 +224,78 @@ def fft_init(length, sign=1):
 
 
 #
-# Reorder FFT sequence
-# Borrowed from: http://www.python.org/topics/scicomp/recipes_in_python.html
+# Check sequence length
 #
-def fft_reorder(x):
-    """Reorder FFT elements"""
-    N, x = len(x), x[:]
+def fft_stages(length):
+    """
+		Calculate radix-2 stage count
+		@param length:		FFT length
+		@return:			stage count (log2 of length)
+	"""
+    stages = 0
+    while 1 << stages < length:
+        stages += 1
+    if 1 << stages != length:
+        raise ValueError("Sequence length is not power of two!")
+    return stages
 
-    for i in range(N):
-        k, b, a = 0, N >> 1, 1
+
+#
+# Calculate bit-reversal table
+# Borrowed from: http://www.python.org/topics/scicomp/recipes_in_python.html
+#
+def fft_bitrev_table(length):
+    """
+		Calculate bit-reversed index for every FFT element
+		@param length:		FFT length
+		@return:			index table
+	"""
+    table = []
+    for i in range(length):
+        k, b, a = 0, length >> 1, 1
         while b >= a:
             if b & i: k = k | a
             if a & i: k = k | b
             b, a = b >> 1, a << 1
+        table.append(k)
+
+    return table
+
+
+#
+# Reorder FFT sequence
+#
+def fft_reorder(x, table=None):
+    """
+		Reorder FFT elements
+		@param x:			FFT sequence in bit-reversed order
+		@param table:		precalculated bit-reversal table (optional)
+		@return:			reordered copy of the sequence
+	"""
+    if table is None:
+        table = fft_bitrev_table(len(x))
+
+    return [x[k] for k in table]
+
+
+#
+# Reorder FFT sequence in place
+#
+def fft_reorder_inplace(x, table=None):
+    """
+		Reorder FFT elements by swapping, works only with bit-reversal
+		tables since they are their own inverse
+		@param x:			FFT sequence in bit-reversed order
+		@param table:		precalculated bit-reversal table (optional)
+	"""
+    if table is None:
+        table = fft_bitrev_table(len(x))
+
+    for i in range(len(x)):
+        k = table[i]
         if i < k:  # important not to swap back
             x[i], x[k] = x[k], x[i]
-
-    return x
+    return
 
 
 #
@@ -172,34 +315,80 @@ def fft_butterfly(a, b, k, butterflies):
     return x, y
 
 
+#
+# Process one FFT stage without progress callbacks
+#
+def fft_stage(fft_buffer, stage, butterflies):
+    """
+		Process all butterflies of a stage in place
+		@param fft_buffer:	list of complex numbers
+		@param stage:		stage number
+		@param butterflies:	butterfly coeff array
+	"""
+    length = len(fft_buffer)
+    groupsize = length >> (stage + 1)
+    twiddles = butterflies[::1 << stage]
+
+    for start in range(0, length, groupsize * 2):
+        i2 = start + groupsize
+        for i1 in range(start, start + groupsize):
+            a = fft_buffer[i1]
+            b = fft_buffer[i2]
+            fft_buffer[i1] = a + b
+            fft_buffer[i2] = (a - b) * twiddles[i1 - start]
+            i2 += 1
+    return
+
+
 #
 # Calculate FFT transform
 #
-def fft_transform(progress, sequence, butterflies):
-    # Check sequence length
-    x = 0
-    while 2**x < len(sequence):
-        x += 1
-    if 2**x != len(sequence):
-        raise "Sequence length is not power of two!"
+def fft_transform(progress, sequence, butterflies, bitrev=None):
+    # initialize buffer to zero with list comprehension
+    fft_buffer = [complex(sequence[x]) for x in range(0, len(sequence))]
+
+    return fft_transform_inplace(progress, fft_buffer, butterflies, bitrev)
+
+
+#
+# Calculate FFT transform in place
+#
+def fft_transform_inplace(progress, fft_buffer, butterflies, bitrev=None):
+    """
+		Calculate FFT over a list of complex numbers, overwriting it
+		@param progress:	Progress listener (None for no callbacks)
+		@param fft_buffer:	list of complex numbers
+		@param butterflies:	butterfly coeff array
+		@param bitrev:		precalculated bit-reversal table (optional)
+		@return:			fft_buffer
+	"""
+    # Without listener nobody wants the callbacks
+    if progress is None:
+        progress = quiet
+
+    # Every n:th butterfly is reported, 0 = no group/butterfly callbacks
+    interval = progress.butterfly_interval
 
     # Sequence length
-    length = len(sequence)
+    length = len(fft_buffer)
 
-    # calculate stage count
-    stages = int(math.log(length, 2))
+    # calculate stage count (checks that length is power of two)
+    stages = fft_stages(length)
 
     progress.fft_start(length, stages)
 
-    # initialize buffer to zero with list comprehension
-    fft_buffer = [complex(sequence[x]) for x in range(0, length)]
-
     for stage in range(0, stages):
         groups = 1 << stage
         groupsize = length >> (stage + 1)
 
         progress.stage_start(stage, groups, groupsize)
 
+        if interval == 0:
+            # Fast path
+            fft_stage(fft_buffer, stage, butterflies)
+            progress.stage_end(stage, groups)
+            continue
+
         for group in range(0, groups):
 
             # Butterfly count. Actual formula is FFT_LEN / 2**(stage+1)
@@ -214,47 +403,921 @@ def fft_transform(progress, sequence, butterflies):
                 a = complex(fft_buffer[i1])
                 b = complex(fft_buffer[i2])
 
-                progress.butterfly_start(stage, group, bflies, a, b, k, i1, i2)
+                # Report only sampled butterflies
+                report = (group * bflies + bfly) % interval == 0
+
+                if report:
+                    progress.butterfly_start(stage, group, bflies, a, b, k,
+                                             i1, i2)
 
                 # Process butterfly
                 x, y = fft_butterfly(a, b, k, butterflies)
 
-                progress.butterfly_info(stage, group, bflies, a, b, x, y)
+                if report:
+                    progress.butterfly_info(stage, group, bflies, a, b, x, y)
 
                 fft_buffer[i1] = x
                 fft_buffer[i2] = y
 
+        progress.stage_end(stage, groups)
+
     progress.fft_end(length, stages)
 
     # Unscramble the sequence
-    fft_buffer = fft_reorder(fft_buffer)
+    fft_reorder_inplace(fft_buffer, bitrev)
+
+    return fft_buffer
+
+
+#
+# Process one FFT stage with NumPy
+#
+def fft_stage_vector(fft_buffer, stage, twiddles, scratch=None):
+    """
+		Process all butterflies of a stage in place
+		@param fft_buffer:	complex128 array, transform runs on last axis
+		@param stage:		stage number
+		@param twiddles:	butterfly coeffs of the stage (length >> stage + 1)
+		@param scratch:		work array of fft_buffer.size elements (optional)
+	"""
+    # View buffer as groups of (a, b) halves
+    groups = fft_buffer.reshape(fft_buffer.shape[:-1] + (1 << stage, 2, -1))
+    a = groups[..., 0, :]
+    b = groups[..., 1, :]
+
+    if scratch is None:
+        diff = a - b
+    else:
+        diff = scratch[:a.size].reshape(a.shape)
+        numpy.subtract(a, b, out=diff)
+    a += b
+    numpy.multiply(diff, twiddles, out=b)
+    return
+
+
+#
+# Calculate FFT transform with NumPy
+#
+def fft_transform_vector(progress, sequence, butterflies, bitrev=None):
+    """
+		Calculate FFT one vectorized stage at a time. Input and output
+		are the same as with fft_transform, but only FFT and stage
+		level progress callbacks are called.
+		@param progress:	Progress listener (None for no callbacks)
+		@param sequence:	Sample sequence to transform, or (..., N) array
+							of sequences transformed along the last axis
+		@param butterflies:	butterfly coeff array
+		@param bitrev:		precalculated bit-reversal table (optional)
+		@return:			FFT result as complex128 array
+	"""
+    if numpy is None:
+        raise ImportError("NumPy engine requires numpy")
+
+    # Copy input to complex buffer
+    fft_buffer = numpy.array(sequence, dtype=numpy.complex128)
+
+    if bitrev is None:
+        bitrev = fft_bitrev_table(fft_buffer.shape[-1])
+    butterflies = numpy.asarray(butterflies, dtype=numpy.complex128)
+
+    return fft_transform_vector_inplace(progress, fft_buffer, butterflies,
+                                        bitrev, numpy.empty(fft_buffer.size,
+                                                            numpy.complex128))
+
+
+#
+# Calculate FFT transform with NumPy in place
+#
+def fft_transform_vector_inplace(progress, fft_buffer, butterflies, bitrev,
+                                 scratch):
+    """
+		Calculate FFT over a C-contiguous complex128 array, overwriting it.
+		Nothing is allocated apart from array views.
+		@param progress:	Progress listener (None for no callbacks)
+		@param fft_buffer:	(..., N) complex128 array
+		@param butterflies:	butterfly coeff array
+		@param bitrev:		bit-reversal index array
+		@param scratch:		work array of fft_buffer.size elements
+		@return:			fft_buffer
+	"""
+    if progress is None:
+        progress = quiet
 
+    # Sequence length
+    length = fft_buffer.shape[-1]
+
+    # calculate stage count (checks that length is power of two)
+    stages = fft_stages(length)
+
+    progress.fft_start(length, stages)
+
+    for stage in range(0, stages):
+        groups = 1 << stage
+        groupsize = length >> (stage + 1)
+
+        progress.stage_start(stage, groups, groupsize)
+
+        # Butterfly k of the stage uses coeff k << stage
+        fft_stage_vector(fft_buffer, stage, butterflies[::groups], scratch)
+
+        progress.stage_end(stage, groups)
+
+    progress.fft_end(length, stages)
+
+    # Unscramble the sequence through the work array
+    reordered = scratch.reshape(fft_buffer.shape)
+    numpy.take(fft_buffer, bitrev, axis=-1, out=reordered)
+    fft_buffer[...] = reordered
     return fft_buffer
 
 
+#
+# View caller's buffer as complex array
+#
+def complex_buffer(buffer):
+    """
+		Get complex128 view of a buffer without copying
+		@param buffer:		C-contiguous complex128 array, or array.array('d'),
+							memoryview or other buffer with interleaved real
+							and imaginary parts
+		@return:			writable complex128 array sharing the memory
+	"""
+    if numpy is None:
+        raise ImportError("NumPy engine requires numpy")
+
+    if isinstance(buffer, numpy.ndarray):
+        if buffer.dtype != numpy.complex128:
+            raise ValueError("In-place buffer must be complex128!")
+    else:
+        if isinstance(buffer, memoryview):
+            buffer = numpy.asarray(buffer)
+        else:
+            buffer = numpy.frombuffer(buffer, dtype=numpy.uint8)
+        buffer = buffer.reshape(-1).view(numpy.complex128)
+
+    if not buffer.flags.c_contiguous or not buffer.flags.writeable:
+        raise ValueError("In-place buffer must be contiguous and writable!")
+    return buffer
+
+
+#-------------------------------------------------------------------------------
+# Mixed radix FFT
+#-------------------------------------------------------------------------------
+
+# Radices with their own kernels, in the order they are used
+mixed_radices = [4, 2, 3, 5]
+
+
+#
+# Check power of two
+#
+def is_power_of_two(length):
+    return length > 0 and length & (length - 1) == 0
+
+
+#
+# Factor FFT length
+#
+def fft_factor(length):
+    """
+		Split length into radix 4, 2, 3 and 5 stages
+		@param length:		FFT length
+		@return:			list of radices, None if length has other factors
+	"""
+    factors = []
+    for radix in mixed_radices:
+        while length % radix == 0 and (radix != 2 or length % 4 != 0):
+            factors.append(radix)
+            length //= radix
+    if length != 1:
+        return None
+    return factors
+
+
+#
+# Calculate mixed radix twiddles
+#
+def fft_mixed_init(length, factors, sign=1):
+    """
+		Calculate twiddle coefficients for every mixed radix stage
+		@param length:		FFT length
+		@param factors:		stage radices
+		@return:			per stage [radix][groupsize] coeff tables
+	"""
+    twiddles = []
+    size = length
+    for radix in factors:
+        groupsize = size // radix
+        twiddles.append([[
+            complex(
+                math.cos(-2.0 * sign * math.pi * float(k * n) / float(size)),
+                -math.sin(2.0 * sign * math.pi * float(k * n) / float(size)))
+            for n in range(0, groupsize)
+        ] for k in range(0, radix)])
+        size = groupsize
+    return twiddles
+
+
+#
+# Calculate digit-reversal table
+#
+def fft_digitrev_table(factors):
+    """
+		Mixed radix version of fft_bitrev_table
+		@param factors:		stage radices
+		@return:			index table
+	"""
+    length = 1
+    for radix in factors:
+        length *= radix
+
+    table = [0] * length
+    for i in range(length):
+        # Stage digits of buffer index, last stage is least significant
+        rest, digits = i, []
+        for radix in reversed(factors):
+            digits.append(rest % radix)
+            rest //= radix
+        digits.reverse()
+
+        # Result index has the first stage least significant
+        k, weight = 0, 1
+        for radix, digit in zip(factors, digits):
+            k += digit * weight
+            weight *= radix
+        table[k] = i
+    return table
+
+
+#
+# Calculate mixed radix FFT transform
+#
+def fft_mixed_transform(progress, sequence, factors, twiddles, digitrev,
+                        sign=1):
+    """
+		Reference mixed radix DIF. Every stage splits each group to radix
+		subgroups with a plain DFT. Only FFT and stage level progress
+		callbacks are called.
+		@param progress:	Progress listener (None for no callbacks)
+		@param sequence:	Sample sequence to transform
+		@param factors:		stage radices
+		@param twiddles:	stage coeffs from fft_mixed_init
+		@param digitrev:	digit-reversal table
+		@param sign:		1 for FFT, -1 for IFFT
+		@return:			FFT result
+	"""
+    if progress is None:
+        progress = quiet
+
+    length = len(sequence)
+    progress.fft_start(length, len(factors))
+
+    fft_buffer = [complex(sequence[x]) for x in range(0, length)]
+
+    size = length
+    for stage, radix in enumerate(factors):
+        groupsize = size // radix
+        progress.stage_start(stage, length // size, groupsize)
+
+        # Radix point DFT coeffs
+        roots = [
+            complex(
+                math.cos(-2.0 * sign * math.pi * float(k) / float(radix)),
+                -math.sin(2.0 * sign * math.pi * float(k) / float(radix)))
+            for k in range(0, radix)
+        ]
+
+        for start in range(0, length, size):
+            rows = [
+                fft_buffer[start + n * groupsize:start + (n + 1) * groupsize]
+                for n in range(0, radix)
+            ]
+            for k in range(0, radix):
+                for i in range(0, groupsize):
+                    value = 0j
+                    for n in range(0, radix):
+                        value += rows[n][i] * roots[(n * k) % radix]
+                    fft_buffer[start + k * groupsize + i] = \
+                        value * twiddles[stage][k][i]
+
+        progress.stage_end(stage, length // size)
+        size = groupsize
+
+    progress.fft_end(length, len(factors))
+
+    # Unscramble the sequence
+    return fft_reorder(fft_buffer, digitrev)
+
+
+#
+# Radix kernels for the NumPy engine
+#
+def fft_radix2(v, sign):
+    a, b = v[..., 0, :], v[..., 1, :]
+    return numpy.stack((a + b, a - b), axis=-2)
+
+
+def fft_radix4(v, sign):
+    a, b, c, d = v[..., 0, :], v[..., 1, :], v[..., 2, :], v[..., 3, :]
+    s0, s1 = a + c, a - c
+    d0, d1 = b + d, (b - d) * (-1j * sign)
+    return numpy.stack((s0 + d0, s1 + d1, s0 - d0, s1 - d1), axis=-2)
+
+
+def fft_radix3(v, sign):
+    a, b, c = v[..., 0, :], v[..., 1, :], v[..., 2, :]
+    t = b + c
+    m = a - 0.5 * t
+    d = (b - c) * (-1j * sign * math.sin(2.0 * math.pi / 3.0))
+    return numpy.stack((a + t, m + d, m - d), axis=-2)
+
+
+def fft_radix5(v, sign):
+    a = v[..., 0, :]
+    t1, d1 = v[..., 1, :] + v[..., 4, :], v[..., 1, :] - v[..., 4, :]
+    t2, d2 = v[..., 2, :] + v[..., 3, :], v[..., 2, :] - v[..., 3, :]
+    c1, c2 = math.cos(2.0 * math.pi / 5.0), math.cos(4.0 * math.pi / 5.0)
+    s1, s2 = math.sin(2.0 * math.pi / 5.0), math.sin(4.0 * math.pi / 5.0)
+    m1 = a + c1 * t1 + c2 * t2
+    m2 = a + c2 * t1 + c1 * t2
+    e1 = (s1 * d1 + s2 * d2) * (-1j * sign)
+    e2 = (s2 * d1 - s1 * d2) * (-1j * sign)
+    return numpy.stack((a + t1 + t2, m1 + e1, m2 + e2, m2 - e2, m1 - e1),
+                       axis=-2)
+
+
+# Kernels by radix
+fft_kernels = {2: fft_radix2, 3: fft_radix3, 4: fft_radix4, 5: fft_radix5}
+
+
+#
+# Calculate mixed radix FFT transform with NumPy
+#
+def fft_mixed_transform_vector(progress, sequence, factors, twiddles,
+                               digitrev, sign=1):
+    """
+		Mixed radix DIF, one vectorized kernel call per stage. Same
+		arguments as fft_mixed_transform, twiddles as (radix, groupsize)
+		arrays. Transforms (..., N) arrays along the last axis.
+	"""
+    if numpy is None:
+        raise ImportError("NumPy engine requires numpy")
+
+    if progress is None:
+        progress = quiet
+
+    fft_buffer = numpy.array(sequence, dtype=numpy.complex128)
+    shape = fft_buffer.shape[:-1]
+    length = fft_buffer.shape[-1]
+
+    progress.fft_start(length, len(factors))
+
+    size = length
+    for stage, radix in enumerate(factors):
+        groupsize = size // radix
+        groups = length // size
+        progress.stage_start(stage, groups, groupsize)
+
+        # View buffer as groups of radix rows
+        v = fft_buffer.reshape(shape + (groups, radix, groupsize))
+        v = fft_kernels[radix](v, sign)
+        v *= twiddles[stage]
+        fft_buffer = v.reshape(shape + (length, ))
+
+        progress.stage_end(stage, groups)
+        size = groupsize
+
+    progress.fft_end(length, len(factors))
+
+    # Unscramble the sequence
+    return fft_buffer[..., digitrev]
+
+
+#
+# Calculate FFT with Bluestein's algorithm
+#
+def fft_bluestein(progress, sequence, plan):
+    """
+		Calculate arbitrary length transform as a convolution with a chirp.
+		The convolution runs on plan's radix-2 sub plans.
+		@param progress:	Progress listener (None for no callbacks)
+		@param sequence:	Sample sequence to transform
+		@param plan:		bluestein transform_plan
+		@return:			Transform result
+	"""
+    length = plan.length
+    chirp = plan.chirp
+    padded = plan.forward.length
+
+    if plan.engine == "numpy":
+        x = numpy.asarray(sequence, dtype=numpy.complex128)
+        a = numpy.zeros(x.shape[:-1] + (padded, ), dtype=numpy.complex128)
+        a[..., :length] = x * chirp
+        a = plan.forward.execute(progress, a)
+        a *= plan.filter
+        a = plan.inverse.execute(progress, a)
+        return a[..., :length] * (chirp / padded)
+
+    a = [complex(sequence[n]) * chirp[n] for n in range(0, length)]
+    a = plan.forward.execute(progress, a + [0j] * (padded - length))
+    a = [value * coeff for value, coeff in zip(a, plan.filter)]
+    a = plan.inverse.execute(progress, a)
+    return [a[k] * chirp[k] / padded for k in range(0, length)]
+
+
+# Mixed radix engines by name
+mixed_engines = {
+    "python": fft_mixed_transform,
+    "numpy": fft_mixed_transform_vector
+}
+
+
+# Transform engines by name
+fft_engines = {"python": fft_transform, "numpy": fft_transform_vector}
+
+
+#-------------------------------------------------------------------------------
+# FFT plans
+#-------------------------------------------------------------------------------
+class transform_plan:
+    """
+		Precalculated tables for one FFT length. The plan kind is
+		"radix2" for powers of two, "mixed" for lengths with only 2, 3
+		and 5 as prime factors and "bluestein" for everything else.
+	"""
+
+    # Constructor
+    def __init__(self, length, sign=1, engine=None):
+        if engine is None:
+            engine = default_fft_engine
+        if engine not in fft_engines:
+            raise ValueError("Unknown FFT engine: %s" % engine)
+        if engine == "numpy" and numpy is None:
+            raise ImportError("NumPy engine requires numpy")
+        if length < 1:
+            raise ValueError("FFT length must be positive!")
+
+        self.length = length
+        self.sign = sign
+        self.engine = engine
+        self.factors = fft_factor(length)
+
+        # Work array for in-place numpy transforms
+        self.scratch = None
+
+        if is_power_of_two(length):
+            self.kind = "radix2"
+            self.transform = fft_engines[engine]
+            self.stages = fft_stages(length)
+            self.butterflies = fft_init(length, sign)
+            self.bitrev = fft_bitrev_table(length)
+
+            # Keep tables as arrays for the vectorized engine
+            if engine == "numpy":
+                self.butterflies = numpy.array(self.butterflies,
+                                               dtype=numpy.complex128)
+                self.bitrev = numpy.array(self.bitrev, dtype=numpy.intp)
+
+        elif self.factors:
+            self.kind = "mixed"
+            self.transform = mixed_engines[engine]
+            self.twiddles = fft_mixed_init(length, self.factors, sign)
+            self.digitrev = fft_digitrev_table(self.factors)
+
+            if engine == "numpy":
+                self.twiddles = [
+                    numpy.array(t, dtype=numpy.complex128)
+                    for t in self.twiddles
+                ]
+                self.digitrev = numpy.array(self.digitrev, dtype=numpy.intp)
+
+        else:
+            self.kind = "bluestein"
+
+            # Radix-2 convolution length
+            padded = 1
+            while padded < 2 * length - 1:
+                padded <<= 1
+            self.forward = fft_plan(padded, 1, engine)
+            self.inverse = fft_plan(padded, -1, engine)
+
+            # Chirp exp(-j*pi*n^2/N), n^2 is taken modulo 2N for accuracy
+            self.chirp = [
+                complex(
+                    math.cos(math.pi * float(n * n % (2 * length)) / length),
+                    -sign * math.sin(
+                        math.pi * float(n * n % (2 * length)) / length))
+                for n in range(0, length)
+            ]
+
+            # Spectrum of the conjugate chirp, wrapped around
+            h = [0j] * padded
+            for n in range(0, length):
+                h[n] = h[-n] = self.chirp[n].conjugate()
+            self.filter = self.forward.execute(None, h)
+
+            if engine == "numpy":
+                self.chirp = numpy.array(self.chirp, dtype=numpy.complex128)
+        return
+
+    # Run transform
+    def execute(self, progress, sequence):
+        """
+		Calculate transform with the precalculated tables
+		@param progress:	Progress listener (None for no callbacks)
+		@param sequence:	Sample sequence to transform
+		@return:			Transform result (inverse result is not scaled)
+	"""
+        # Arrays are transformed along the last axis
+        shape = getattr(sequence, "shape", None)
+        if shape:
+            length = shape[-1]
+        else:
+            length = len(sequence)
+
+        if length != self.length:
+            raise ValueError("Sequence length does not match the plan!")
+
+        if self.kind == "radix2":
+            return self.transform(progress, sequence, self.butterflies,
+                                  self.bitrev)
+        if self.kind == "mixed":
+            return self.transform(progress, sequence, self.factors,
+                                  self.twiddles, self.digitrev, self.sign)
+        return fft_bluestein(progress, sequence, self)
+
+    # Run transform in place
+    def execute_inplace(self, progress, buffer):
+        """
+		Calculate transform over caller's buffer. Power of two lengths
+		run without allocating anything after the first call with a new
+		buffer shape; other lengths transform a copy and write it back.
+		The work array is shared, so a plan must not be used by several
+		threads at once.
+		@param progress:	Progress listener (None for no callbacks)
+		@param buffer:		list of complex numbers (python engine) or
+							(..., N) C-contiguous complex128 array
+		@return:			buffer
+	"""
+        shape = getattr(buffer, "shape", None)
+        if shape:
+            length = shape[-1]
+        else:
+            length = len(buffer)
+
+        if length != self.length:
+            raise ValueError("Sequence length does not match the plan!")
+
+        if self.kind != "radix2":
+            result = self.execute(progress, buffer)
+            if shape:
+                buffer[...] = result
+            else:
+                buffer[:] = result
+            return buffer
+
+        if self.engine == "python":
+            return fft_transform_inplace(progress, buffer, self.butterflies,
+                                         self.bitrev)
+
+        if self.scratch is None or self.scratch.size != buffer.size:
+            self.scratch = numpy.empty(buffer.size, numpy.complex128)
+        return fft_transform_vector_inplace(progress, buffer,
+                                            self.butterflies, self.bitrev,
+                                            self.scratch)
+
+
+# Plan cache, least recently used plan first
+plan_cache = collections.OrderedDict()
+
+
+#
+# Get plan from cache
+#
+def cached_plan(key, factory, *args):
+    """
+		Get plan from the LRU cache, creating it when missing
+		@param key:			cache key
+		@param factory:		plan constructor
+		@param args:		constructor arguments
+		@return:			plan instance
+	"""
+    try:
+        plan = plan_cache.pop(key)
+    except KeyError:
+        plan = factory(*args)
+        while len(plan_cache) >= max(fft_plan_cache_size, 1):
+            plan_cache.popitem(last=False)
+
+    # Most recently used plan goes last
+    plan_cache[key] = plan
+    return plan
+
+
+#
+# Get FFT plan from cache
+#
+def fft_plan(length, sign=1, engine=None):
+    """
+		Get plan for given length and direction. Plans are kept in a
+		LRU cache of fft_plan_cache_size entries.
+		@param length:		FFT length
+		@param sign:		1 for FFT, -1 for IFFT
+		@param engine:		"python" or "numpy" (default_fft_engine if None)
+		@return:			transform_plan instance
+	"""
+    if engine is None:
+        engine = default_fft_engine
+
+    return cached_plan((length, sign, engine), transform_plan, length, sign,
+                       engine)
+
+
 #
 # Calculate FFT for sequence
 #
-def fft(progress, sequence):
+def fft(progress, sequence, engine=None, out=None):
     """
 		Calculate FFT.
 		@param sequence:	Sample sequence to transform
-		@param butterflies:	butterfly coefficients
+		@param engine:		"python" or "numpy" (default_fft_engine if None)
+		@param out:			buffer for the result (optional), see fft_inplace
 		@return:			FFT result
 	"""
-    # Calculate butterflies
-    butterflies = fft_init(len(sequence))
-    fft = fft_transform(progress, sequence, butterflies)
-    return fft
+    if out is not None:
+        return fft_inplace(progress, fill_buffer(out, sequence, engine),
+                           engine)
+    return fft_plan(len(sequence), 1, engine).execute(progress, sequence)
 
 
 #
 # Calculate IFFT for sequence
 #
-def ifft(progress, sequence):
-    butterflies = fft_init(len(sequence), -1)
-    fft = fft_transform(progress, sequence, butterflies)
-    return [fft[x] / len(fft) for x in range(0, len(fft) - 1)]
+def ifft(progress, sequence, engine=None, out=None):
+    if out is not None:
+        return ifft_inplace(progress, fill_buffer(out, sequence, engine),
+                            engine)
+
+    plan = fft_plan(len(sequence), -1, engine)
+    fft = plan.execute(progress, sequence)
+    if plan.engine == "numpy":
+        return fft / len(fft)
+    return [value / len(fft) for value in fft]
+
+
+#
+# Copy sequence to result buffer
+#
+def fill_buffer(out, sequence, engine=None):
+    """
+		Copy sequence to caller's result buffer
+		@param out:			result buffer, see fft_inplace
+		@param sequence:	Sample sequence
+		@param engine:		"python" or "numpy" (default_fft_engine if None)
+		@return:			buffer to transform in place
+	"""
+    if engine is None:
+        engine = default_fft_engine
+
+    if engine == "numpy":
+        out = complex_buffer(out)
+        if out is not sequence:
+            out[...] = sequence
+    elif out is not sequence:
+        out[:] = sequence
+    return out
+
+
+#
+# Calculate FFT in place
+#
+def fft_inplace(progress, buffer, engine=None, sign=1):
+    """
+		Calculate FFT over caller's buffer without allocating a result
+		@param buffer:		list of complex numbers with python engine.
+							With numpy engine complex128 array, or
+							array.array('d'), memoryview or other writable
+							buffer with interleaved real and imaginary parts.
+		@param engine:		"python" or "numpy" (default_fft_engine if None)
+		@param sign:		1 for FFT, -1 for unscaled IFFT
+		@return:			buffer (complex128 view of it with numpy engine)
+	"""
+    if engine is None:
+        engine = default_fft_engine
+
+    if engine == "numpy":
+        buffer = complex_buffer(buffer)
+        length = buffer.shape[-1]
+    else:
+        length = len(buffer)
+
+    return fft_plan(length, sign, engine).execute_inplace(progress, buffer)
+
+
+#
+# Calculate IFFT in place
+#
+def ifft_inplace(progress, buffer, engine=None):
+    """
+		Calculate IFFT over caller's buffer, see fft_inplace
+	"""
+    buffer = fft_inplace(progress, buffer, engine, -1)
+
+    length = len(buffer)
+    if hasattr(buffer, "shape"):
+        buffer *= 1.0 / buffer.shape[-1]
+    else:
+        for i in range(length):
+            buffer[i] /= length
+    return buffer
+
+
+#
+# Calculate FFT for a batch of frames
+#
+def fft_batch(progress, frames):
+    """
+		Calculate FFT of every frame with the numpy engine. All frames go
+		through each stage together and share one butterfly table.
+		@param frames:		(B, N) array of frames
+		@return:			(B, N) array of FFT results
+	"""
+    if numpy is None:
+        raise ImportError("Batch FFT requires numpy")
+
+    frames = numpy.asarray(frames)
+    if frames.ndim != 2:
+        raise ValueError("Frames must be a (B, N) array!")
+    return fft_plan(frames.shape[1], 1, "numpy").execute(progress, frames)
+
+
+#
+# Calculate IFFT for a batch of frames
+#
+def ifft_batch(progress, frames):
+    """
+		Calculate IFFT of every frame, see fft_batch
+		@param frames:		(B, N) array of frames
+		@return:			(B, N) array of IFFT results
+	"""
+    if numpy is None:
+        raise ImportError("Batch FFT requires numpy")
+
+    frames = numpy.asarray(frames)
+    if frames.ndim != 2:
+        raise ValueError("Frames must be a (B, N) array!")
+    fft = fft_plan(frames.shape[1], -1, "numpy").execute(progress, frames)
+    return fft / frames.shape[1]
+
+
+#-------------------------------------------------------------------------------
+# Real input FFT
+#-------------------------------------------------------------------------------
+class real_plan:
+    """
+		Real FFT of length N computed with a N/2 complex transform.
+		Even samples go to the real part and odd samples to the imaginary
+		part, and the half-length spectrum is split back to N/2+1 bins.
+	"""
+
+    # Constructor
+    def __init__(self, length, engine=None):
+        if length < 2 or length % 2:
+            raise ValueError("Real FFT length must be even!")
+
+        half = length // 2
+        self.length = length
+        self.forward = fft_plan(half, 1, engine)
+        self.inverse = fft_plan(half, -1, engine)
+        self.engine = self.forward.engine
+
+        # Split coeffs W^k = exp(-j*2*pi*k/N), k = 0..N/2
+        self.twiddles = [
+            complex(
+                math.cos(2.0 * math.pi * float(k) / float(length)),
+                -math.sin(2.0 * math.pi * float(k) / float(length)))
+            for k in range(0, half + 1)
+        ]
+
+        # Spectrum indexes k and N/2-k (mod N/2)
+        self.index = [k % half for k in range(0, half + 1)]
+        self.mirror = [(half - k) % half for k in range(0, half + 1)]
+
+        if self.engine == "numpy":
+            self.twiddles = numpy.array(self.twiddles, dtype=numpy.complex128)
+            self.index = numpy.array(self.index, dtype=numpy.intp)
+            self.mirror = numpy.array(self.mirror, dtype=numpy.intp)
+        return
+
+    # Real FFT
+    def execute(self, progress, sequence):
+        """
+		Calculate FFT of real sequence
+		@param progress:	Progress listener (None for no callbacks)
+		@param sequence:	N real samples
+		@return:			N/2+1 spectrum bins
+	"""
+        if len(sequence) != self.length:
+            raise ValueError("Sequence length does not match the plan!")
+
+        if self.engine == "numpy":
+            # Pairs of reals are viewed as complex numbers without copying
+            x = numpy.ascontiguousarray(sequence, dtype=numpy.float64)
+            z = self.forward.execute(progress, x.view(numpy.complex128))
+
+            a = z[self.index]
+            b = z[self.mirror].conj()
+            return 0.5 * (a + b) - 0.5j * self.twiddles * (a - b)
+
+        half = self.length // 2
+        z = [complex(sequence[2 * n], sequence[2 * n + 1])
+             for n in range(0, half)]
+        z = self.forward.execute(progress, z)
+
+        result = []
+        for k in range(0, half + 1):
+            a = z[self.index[k]]
+            b = z[self.mirror[k]].conjugate()
+            result.append(0.5 * (a + b) - 0.5j * self.twiddles[k] * (a - b))
+        return result
+
+    # Inverse real FFT
+    def execute_inverse(self, progress, spectrum):
+        """
+		Calculate real IFFT
+		@param progress:	Progress listener (None for no callbacks)
+		@param spectrum:	N/2+1 spectrum bins
+		@return:			N real samples
+	"""
+        half = self.length // 2
+        if len(spectrum) != half + 1:
+            raise ValueError("Spectrum length does not match the plan!")
+
+        if self.engine == "numpy":
+            x = numpy.asarray(spectrum, dtype=numpy.complex128)
+            a = x[:half]
+            b = x[half:0:-1].conj()
+            z = 0.5 * (a + b) + 0.5j * self.twiddles[:half].conj() * (a - b)
+
+            z = self.inverse.execute(progress, z) / half
+            return z.view(numpy.float64)
+
+        z = []
+        for k in range(0, half):
+            a = complex(spectrum[k])
+            b = complex(spectrum[half - k]).conjugate()
+            z.append(0.5 * (a + b) + 0.5j * self.twiddles[k].conjugate() *
+                     (a - b))
+        z = self.inverse.execute(progress, z)
+
+        result = []
+        for value in z:
+            result.append(value.real / half)
+            result.append(value.imag / half)
+        return result
+
+
+#
+# Get real FFT plan from cache
+#
+def rfft_plan(length, engine=None):
+    """
+		Get real FFT plan for given length (shares the FFT plan cache)
+		@param length:		Real sequence length
+		@param engine:		"python" or "numpy" (default_fft_engine if None)
+		@return:			real_plan instance
+	"""
+    if engine is None:
+        engine = default_fft_engine
+
+    return cached_plan((length, "real", engine), real_plan, length, engine)
+
+
+#
+# Calculate FFT for real sequence
+#
+def rfft(progress, sequence, engine=None):
+    """
+		Calculate FFT of real sequence with half-length complex FFT
+		@param sequence:	N real samples (N even)
+		@param engine:		"python" or "numpy" (default_fft_engine if None)
+		@return:			N/2+1 first FFT bins
+	"""
+    return rfft_plan(len(sequence), engine).execute(progress, sequence)
+
+
+#
+# Calculate IFFT for real sequence
+#
+def irfft(progress, spectrum, engine=None):
+    """
+		Inverse of rfft
+		@param spectrum:	N/2+1 FFT bins
+		@param engine:		"python" or "numpy" (default_fft_engine if None)
+		@return:			N real samples
+	"""
+    length = 2 * (len(spectrum) - 1)
+    return rfft_plan(length, engine).execute_inverse(progress, spectrum)
 
 
 #
@@ -270,13 +1333,19 @@ def main():
     else:
         fftsize = default_fft_len
 
+    if len(sys.argv) > 2:
+        engine = sys.argv[2]
+    else:
+        engine = default_fft_engine
+
     print "Decimation-In-Frequency Radix-2 FFT"
     print "Harri Salokorpi <harri.salokorpi@iki.fi"
     print ""
-    print "Usage: python fft-python.py <fft size>"
+    print "Usage: python fft-python.py <fft size> [python|numpy]"
     print "  fft size defaults to %(size)s" % {"size": default_fft_len}
     print ""
     print "Used FFT length:", fftsize
+    print "Used FFT engine:", engine
 
     # Initialize test sequence
     sequence = [float(x) for x in range(1, fftsize + 1)]
@@ -285,7 +1354,7 @@ def main():
     p = progress()
 
     # Calculate fft
-    fft_result = fft(p, sequence)
+    fft_result = fft(p, sequence, engine)
 
     print ""
     print "FFT results:"
@@ -295,7 +1364,7 @@ def main():
     print "Inverse FFT:"
     print ""
 
-    ifft_result = ifft(p, fft_result)
+    ifft_result = ifft(p, fft_result, engine)
 
     print ""
     print "FFT results:"
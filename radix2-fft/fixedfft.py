@@ -0,0 +1,235 @@
+#!/usr/bin/python
+
+import sys
+import math
+import numpy
+
+import fft
+
+#-------------------------------------------------------------------------------
+# Fixed-point Radix-2 FFT
+#
+# Same Decimation-In-Frequency structure as fft.py, but samples and twiddles
+# are integers (Q15 with bits=16, Q31 with bits=32). All arithmetic is done in
+# int64 numpy arrays with explicit shifts, rounding and saturation, so results
+# are bit-exact and reproducible on a fixed-point target.
+#
+# Butterfly of a stage:
+#	s = (a + b) >> shift
+#	d = (a - b) >> shift
+#	a' = sat(s)
+#	b' = sat((sat(d) * W + round) >> (bits - 1))
+#
+# shift is 1 on every stage with "stage" scaling, 0 with "none" scaling, and
+# with "bfp" (block floating point) 1 only when the block peak before the
+# stage is at least 2**(bits - 2). The number of shifts is returned as the
+# block exponent: true result = output * 2**exponent.
+#-------------------------------------------------------------------------------
+
+# Scaling modes
+scaling_modes = ["stage", "bfp", "none"]
+
+# Rounding modes: "nearest" adds half before shifting, "floor" just shifts
+rounding_modes = ["nearest", "floor"]
+
+
+#
+# Arithmetic shift right with rounding
+#
+def shift_right(x, shift, rounding="nearest"):
+    """
+		Shift int64 array right
+		@param x:			int64 array
+		@param shift:		shift count (int or int64 array broadcast to x)
+		@param rounding:	"nearest" or "floor"
+		@return:			shifted array
+	"""
+    if rounding == "nearest":
+        x = x + (numpy.left_shift(1, shift) >> 1)
+    return x >> shift
+
+
+#
+# Quantize twiddles
+#
+def fixed_twiddles(length, bits, sign=1):
+    """
+		Quantize fft.fft_init butterfly coeffs to Q(bits-1)
+		@param length:		FFT length
+		@param bits:		word length
+		@param sign:		1 for FFT, -1 for IFFT
+		@return:			(real, imag) int64 arrays
+	"""
+    scale = float(1 << (bits - 1))
+    limit = (1 << (bits - 1)) - 1
+
+    butterflies = numpy.array(fft.fft_init(length, sign),
+                              dtype=numpy.complex128)
+    real = numpy.floor(butterflies.real * scale + 0.5).astype(numpy.int64)
+    imag = numpy.floor(butterflies.imag * scale + 0.5).astype(numpy.int64)
+    return numpy.clip(real, -limit - 1, limit), numpy.clip(imag, -limit - 1,
+                                                          limit)
+
+
+#-------------------------------------------------------------------------------
+# Fixed-point FFT
+#-------------------------------------------------------------------------------
+class FixedFFT:
+    # Constructor
+    def __init__(self,
+                 length,
+                 bits=16,
+                 scaling="stage",
+                 rounding="nearest",
+                 sign=1):
+        if scaling not in scaling_modes:
+            raise ValueError("Unknown scaling: %s" % scaling)
+        if rounding not in rounding_modes:
+            raise ValueError("Unknown rounding: %s" % rounding)
+        if bits < 2 or bits > 32:
+            raise ValueError("Word length must be 2..32 bits")
+
+        self.length = length
+        self.bits = bits
+        self.scaling = scaling
+        self.rounding = rounding
+        self.stages = fft.fft_stages(length)
+        self.low = -(1 << (bits - 1))
+        self.high = (1 << (bits - 1)) - 1
+        self.twiddles = fixed_twiddles(length, bits, sign)
+        self.bitrev = numpy.array(fft.fft_bitrev_table(length),
+                                  dtype=numpy.intp)
+        self.reset_counters()
+        return
+
+    # Clear overflow counters
+    def reset_counters(self):
+        self.input_overflows = 0
+        self.overflows = numpy.zeros(self.stages, dtype=numpy.int64)
+        return
+
+    # Saturate array in place, returns number of clipped values
+    def saturate(self, x):
+        count = numpy.count_nonzero((x < self.low) | (x > self.high))
+        if count:
+            numpy.clip(x, self.low, self.high, out=x)
+        return count
+
+    # Calculate FFT of integer samples
+    def execute(self, real, imag=None):
+        """
+		Calculate fixed-point FFT
+		@param real:		real parts, int array of shape (..., N)
+		@param imag:		imaginary parts (zero if None)
+		@return:			(real, imag, exponent) where exponent has the
+							leading shape of the input
+	"""
+        re = numpy.array(real, dtype=numpy.int64)
+        if imag is None:
+            im = numpy.zeros_like(re)
+        else:
+            im = numpy.array(imag, dtype=numpy.int64)
+
+        if re.shape[-1] != self.length or im.shape != re.shape:
+            raise ValueError("Sequence length does not match the FFT!")
+
+        self.input_overflows += self.saturate(re) + self.saturate(im)
+
+        shape = re.shape[:-1]
+        exponent = numpy.zeros(shape, dtype=numpy.int64)
+        wr, wi = self.twiddles
+        qbits = self.bits - 1
+
+        for stage in range(0, self.stages):
+            groups = 1 << stage
+
+            # Stage scaling
+            if self.scaling == "stage":
+                shift = 1
+                exponent += 1
+            elif self.scaling == "bfp":
+                peak = numpy.maximum(
+                    numpy.abs(re).max(axis=-1), numpy.abs(im).max(axis=-1))
+                shift = (peak >= 1 << (self.bits - 2)).astype(numpy.int64)
+                exponent += shift
+                shift = shift[..., numpy.newaxis, numpy.newaxis]
+            else:
+                shift = 0
+
+            # View buffers as groups of (a, b) halves
+            vr = re.reshape(shape + (groups, 2, -1))
+            vi = im.reshape(shape + (groups, 2, -1))
+            ar, br = vr[..., 0, :], vr[..., 1, :]
+            ai, bi = vi[..., 0, :], vi[..., 1, :]
+
+            sr = shift_right(ar + br, shift, self.rounding)
+            si = shift_right(ai + bi, shift, self.rounding)
+            dr = shift_right(ar - br, shift, self.rounding)
+            di = shift_right(ai - bi, shift, self.rounding)
+
+            count = self.saturate(sr) + self.saturate(si)
+            count += self.saturate(dr) + self.saturate(di)
+
+            # Butterfly k of the stage uses coeff k << stage
+            tr, ti = wr[::groups], wi[::groups]
+            pr = shift_right(dr * tr - di * ti, qbits, self.rounding)
+            pi = shift_right(dr * ti + di * tr, qbits, self.rounding)
+            count += self.saturate(pr) + self.saturate(pi)
+
+            ar[...], ai[...] = sr, si
+            br[...], bi[...] = pr, pi
+            self.overflows[stage] += count
+
+        # Unscramble the sequence
+        return re[..., self.bitrev], im[..., self.bitrev], exponent
+
+
+#
+# Convert fixed-point result to complex
+#
+def to_complex(real, imag, exponent):
+    """
+		Scale fixed-point FFT output back to the input scale
+		@return:			complex128 array
+	"""
+    scale = numpy.power(2.0, numpy.asarray(exponent))[..., numpy.newaxis]
+    return (numpy.asarray(real) + 1j * numpy.asarray(imag)) * scale
+
+
+#
+# Main function
+#
+def main():
+    """
+		Main method
+	"""
+    length = 256
+    if len(sys.argv) > 1:
+        length = int(sys.argv[1])
+
+    print "Fixed-point Radix-2 FFT"
+    print "Usage: python fixedfft.py <fft size>"
+    print ""
+
+    # Two tones at half scale
+    n = numpy.arange(length)
+    signal = 0.25 * numpy.sin(2 * math.pi * 5 * n / length) + \
+             0.25 * numpy.cos(2 * math.pi * 17 * n / length)
+
+    for bits in [16, 32]:
+        samples = numpy.floor(signal * (1 << (bits - 1)) + 0.5)
+        reference = numpy.fft.fft(samples)
+
+        for scaling in scaling_modes:
+            ffft = FixedFFT(length, bits, scaling)
+            result = to_complex(*ffft.execute(samples))
+            error = numpy.abs(result - reference).max()
+            snr = 20 * math.log10(
+                numpy.abs(reference).max() / max(error, 1e-300))
+            print "Q%-2d %-5s: SNR %6.1f dB, overflows %i" % \
+             (bits - 1, scaling, snr, ffft.overflows.sum())
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/python
+
+import sys
+import math
+import wave
+import numpy
+
+import fft
+
+#-------------------------------------------------------------------------------
+# Streaming Short-Time Fourier Transform on top of the FFT in fft.py
+#
+# WAV files are read in hop sized chunks and frames are produced lazily, so
+# memory use stays at one frame regardless of the file length. The inverse
+# transform is a streaming weighted overlap-add.
+#-------------------------------------------------------------------------------
+
+# Default frame length
+default_frame_len = 1024
+
+# Default hop between frames
+default_hop = 256
+
+
+#-------------------------------------------------------------------------------
+# Windows
+#-------------------------------------------------------------------------------
+def make_window(window, length):
+    """
+		Create analysis window
+		@param window:		"hann", "hamming", "rect" or array of coeffs
+		@param length:		frame length
+		@return:			window as float64 array
+	"""
+    if not isinstance(window, str):
+        window = numpy.asarray(window, dtype=numpy.float64)
+        if window.shape != (length, ):
+            raise ValueError("Window length does not match frame length!")
+        return window
+
+    # Periodic windows sum to a constant with suitable hops
+    n = numpy.arange(length) * (2.0 * math.pi / length)
+    if window == "hann":
+        return 0.5 - 0.5 * numpy.cos(n)
+    if window == "hamming":
+        return 0.54 - 0.46 * numpy.cos(n)
+    if window == "rect":
+        return numpy.ones(length)
+    raise ValueError("Unknown window: %s" % window)
+
+
+#-------------------------------------------------------------------------------
+# WAV input
+#-------------------------------------------------------------------------------
+def pcm_to_float(data, width, channels, channel=None):
+    """
+		Convert PCM frames to floats in [-1, 1)
+		@param data:		frame data from wave.readframes
+		@param width:		sample width in bytes (1, 2 or 4)
+		@param channels:	channel count
+		@param channel:		channel to pick, None mixes all channels
+		@return:			float64 array of samples
+	"""
+    if width == 1:
+        samples = numpy.frombuffer(data, dtype=numpy.uint8) - 128.0
+    elif width == 2:
+        samples = numpy.frombuffer(data, dtype="<i2").astype(numpy.float64)
+    elif width == 4:
+        samples = numpy.frombuffer(data, dtype="<i4").astype(numpy.float64)
+    else:
+        raise ValueError("Unsupported sample width: %i" % width)
+    samples *= 1.0 / (1 << (8 * width - 1))
+
+    samples = samples.reshape(-1, channels)
+    if channel is None:
+        return samples.mean(axis=1)
+    return samples[:, channel]
+
+
+def wav_chunks(filename, chunksize, channel=None):
+    """
+		Read WAV file in chunks
+		@param filename:	WAV file name or open file
+		@param chunksize:	frames per chunk
+		@param channel:		channel to pick, None mixes all channels
+		@return:			generator of float64 sample arrays
+	"""
+    wavein = wave.open(filename, "rb")
+    try:
+        width = wavein.getsampwidth()
+        channels = wavein.getnchannels()
+        while True:
+            data = wavein.readframes(chunksize)
+            if not data:
+                break
+            yield pcm_to_float(data, width, channels, channel)
+    finally:
+        wavein.close()
+    return
+
+
+#-------------------------------------------------------------------------------
+# STFT
+#-------------------------------------------------------------------------------
+def stft(source,
+         length=default_frame_len,
+         hop=default_hop,
+         window="hann",
+         engine="numpy",
+         channel=None):
+    """
+		Calculate STFT frame by frame. The signal is preceded by
+		length - hop zeros and followed by zeros until the last sample has
+		passed through every frame, so that istft can rebuild all samples.
+		@param source:		WAV file name or iterable of sample chunks
+		@param length:		frame length (even)
+		@param hop:			samples between frame starts
+		@param window:		window name or coeffs, see make_window
+		@param engine:		FFT engine used by fft.rfft
+		@param channel:		WAV channel, None mixes all channels
+		@return:			generator of length/2+1 bin spectra
+	"""
+    if hop < 1 or hop > length:
+        raise ValueError("Hop must be between 1 and frame length!")
+
+    win = make_window(window, length)
+    plan = fft.rfft_plan(length, engine)
+
+    if isinstance(source, str) or hasattr(source, "read"):
+        source = wav_chunks(source, hop, channel)
+
+    # Frame under construction, filled up to 'filled', last real sample at
+    # 'last' (-1 when the frame holds padding only)
+    frame = numpy.zeros(length)
+    filled = length - hop
+    last = -1
+
+    for chunk in source:
+        chunk = numpy.asarray(chunk, dtype=numpy.float64)
+        pos = 0
+        while pos < len(chunk):
+            count = min(length - filled, len(chunk) - pos)
+            frame[filled:filled + count] = chunk[pos:pos + count]
+            filled += count
+            pos += count
+            last = filled - 1
+
+            if filled == length:
+                yield numpy.asarray(plan.execute(None, frame * win))
+                frame[:length - hop] = frame[hop:]
+                filled = length - hop
+                last -= hop
+
+    # Zero pad until the last sample has left the frame
+    while last >= 0:
+        frame[filled:] = 0.0
+        yield numpy.asarray(plan.execute(None, frame * win))
+        frame[:length - hop] = frame[hop:]
+        filled = length - hop
+        last -= hop
+    return
+
+
+def spectrogram(source,
+                length=default_frame_len,
+                hop=default_hop,
+                window="hann",
+                engine="numpy",
+                channel=None):
+    """
+		Magnitude spectrogram in dB, one frame at a time (see stft)
+		@return:			generator of length/2+1 bin dB arrays
+	"""
+    for spectrum in stft(source, length, hop, window, engine, channel):
+        yield 20.0 * numpy.log10(numpy.maximum(numpy.abs(spectrum), 1e-12))
+    return
+
+
+#-------------------------------------------------------------------------------
+# Inverse STFT
+#-------------------------------------------------------------------------------
+def istft(frames,
+          length=default_frame_len,
+          hop=default_hop,
+          window="hann",
+          engine="numpy"):
+    """
+		Rebuild signal from stft frames with weighted overlap-add. Every
+		frame is windowed again and the sum is divided by the overlapped
+		squared window. The leading padding added by stft is dropped,
+		trailing padding comes out as (near) zero samples. Raises
+		ValueError if the overlapped squared window is zero anywhere.
+		@param frames:		iterable of length/2+1 bin spectra
+		@param length:		frame length used in stft
+		@param hop:			hop used in stft
+		@param window:		window used in stft
+		@param engine:		FFT engine used by fft.irfft
+		@return:			generator of hop sample float64 arrays
+	"""
+    if hop < 1 or hop > length:
+        raise ValueError("Hop must be between 1 and frame length!")
+
+    win = make_window(window, length)
+    plan = fft.rfft_plan(length, engine)
+
+    # Steady state sum of squared windows, periodic in hop
+    norm = numpy.zeros(hop)
+    for start in range(0, length, hop):
+        part = win[start:start + hop]**2
+        norm[:len(part)] += part
+    if norm.min() < 1e-12 * max(norm.max(), 1e-300):
+        raise ValueError("Window and hop can not be inverted!")
+    norm = 1.0 / norm
+
+    acc = numpy.zeros(length)
+    skip = length - hop
+
+    for spectrum in frames:
+        acc += numpy.asarray(plan.execute_inverse(None, spectrum)) * win
+
+        block = acc[:hop] * norm
+        acc[:length - hop] = acc[hop:]
+        acc[length - hop:] = 0.0
+
+        # Drop leading padding
+        if skip >= hop:
+            skip -= hop
+            continue
+        if skip:
+            block = block[skip:]
+            skip = 0
+        yield block
+    return
+
+
+#
+# Main function
+#
+def main():
+    """
+		Main method
+	"""
+    if len(sys.argv) < 2:
+        print "Usage: python stft.py <wav file> [frame length] [hop]"
+        return
+
+    filename = sys.argv[1]
+    length = default_frame_len
+    hop = default_hop
+    if len(sys.argv) > 2:
+        length = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        hop = int(sys.argv[3])
+
+    wavein = wave.open(filename, "rb")
+    samplerate = wavein.getframerate()
+    wavein.close()
+
+    print "Frame: %i, Hop: %i, Samplerate: %i" % (length, hop, samplerate)
+
+    # Print strongest bin of every frame
+    for index, frame in enumerate(spectrogram(filename, length, hop)):
+        peak = numpy.argmax(frame)
+        print "%6d: %8.1f Hz %6.1f dB" % \
+         (index, peak * float(samplerate) / length, frame[peak])
+
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#-------------------------------------------------------------------------------
+# Tests of convolve.py against numpy.convolve
+#
+# Run with: python -m unittest discover -s radix2-fft
+#-------------------------------------------------------------------------------
+
+import unittest
+
+import numpy
+
+import convolve
+
+# Transform engines under test
+engines = ["python", "numpy"]
+
+
+class ConvolveTest(unittest.TestCase):
+    """Overlap-save convolution against numpy.convolve"""
+
+    # (taps, block sizes), None is the default block (kernel length)
+    cases = [(1, [None, 1, 7, 64]), (3, [None, 1, 16, 100]),
+             (100, [None, 7, 64, 1000]), (4096, [None, 512])]
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(9)
+        return
+
+    def test_matches_numpy(self):
+        for engine in engines:
+            for taps, blocksizes in self.cases:
+                kernel = self.random.randn(taps)
+                signal = self.random.randn(1500)
+                expected = numpy.convolve(signal, kernel)
+                for blocksize in blocksizes:
+                    result = convolve.convolve(signal, kernel, blocksize,
+                                               engine)
+                    self.assertEqual(result.shape, expected.shape)
+                    numpy.testing.assert_allclose(
+                        result, expected, rtol=0, atol=1e-9 * taps,
+                        err_msg="%s engine, %d taps, block %s" %
+                        (engine, taps, blocksize))
+        return
+
+    def test_streaming_matches_one_shot(self):
+        for engine in engines:
+            kernel = self.random.randn(100)
+            signal = self.random.randn(64 * 20)
+            expected = convolve.convolve(signal, kernel, 64, engine)
+
+            ols = convolve.OverlapSave(kernel, 64, engine)
+            out = numpy.concatenate([
+                ols.filter(signal[start:start + 64])
+                for start in range(0, len(signal), 64)
+            ])
+            numpy.testing.assert_allclose(out, expected[:len(signal)],
+                                          rtol=0, atol=1e-12,
+                                          err_msg=engine)
+
+            # Reset starts over from silence
+            ols.reset()
+            numpy.testing.assert_allclose(ols.filter(signal[:64]),
+                                          expected[:64], rtol=0, atol=1e-12)
+        return
+
+    def test_wrong_block_size(self):
+        ols = convolve.OverlapSave(self.random.randn(10), 32)
+        self.assertRaises(ValueError, ols.filter, numpy.zeros(31))
+        self.assertRaises(ValueError, ols.filter, numpy.zeros(33))
+        self.assertRaises(ValueError, ols.filter, numpy.zeros((2, 32)))
+        self.assertRaises(ValueError, convolve.OverlapSave, [])
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
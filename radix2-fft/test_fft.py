@@ -0,0 +1,142 @@
+#-------------------------------------------------------------------------------
+# Tests of fft.py against numpy.fft
+#
+# Run with: python -m unittest discover -s radix2-fft
+#-------------------------------------------------------------------------------
+
+import unittest
+
+import numpy
+
+import fft
+
+# Transform engines under test
+engines = ["python", "numpy"]
+
+
+class MixedLengthFFTTest(unittest.TestCase):
+    """Mixed radix and Bluestein lengths against numpy.fft"""
+
+    # Smooth lengths (factors 2, 3 and 5) use mixed radix, others Bluestein
+    smooth_lengths = [3, 5, 6, 9, 12, 15, 25, 48, 60, 125, 1000, 4800]
+    prime_lengths = [7, 11, 13, 97, 1009]
+    other_lengths = [14, 22, 77, 1001]
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(6)
+        self.lengths = self.smooth_lengths + self.prime_lengths + \
+         self.other_lengths
+        return
+
+    def complex_sequence(self, length):
+        return self.random.randn(length) + 1j * self.random.randn(length)
+
+    def test_plan_kind(self):
+        for length in self.smooth_lengths:
+            self.assertTrue(fft.fft_factor(length) is not None,
+                            "N = %d" % length)
+        for length in self.prime_lengths + self.other_lengths:
+            self.assertTrue(fft.fft_factor(length) is None, "N = %d" % length)
+        return
+
+    def test_fft_matches_numpy(self):
+        for engine in engines:
+            for length in self.lengths:
+                x = self.complex_sequence(length)
+                result = numpy.asarray(fft.fft(None, x.tolist(), engine))
+                numpy.testing.assert_allclose(
+                    result, numpy.fft.fft(x), rtol=0, atol=1e-9 * length,
+                    err_msg="%s engine, N = %d" % (engine, length))
+        return
+
+    def test_ifft_matches_numpy(self):
+        for engine in engines:
+            for length in self.lengths:
+                x = self.complex_sequence(length)
+                result = numpy.asarray(fft.ifft(None, x.tolist(), engine))
+                numpy.testing.assert_allclose(
+                    result, numpy.fft.ifft(x), rtol=0, atol=1e-12 * length,
+                    err_msg="%s engine, N = %d" % (engine, length))
+        return
+
+    def test_ifft_inverts_fft(self):
+        for engine in engines:
+            for length in self.lengths:
+                x = self.complex_sequence(length)
+                spectrum = fft.fft(None, x.tolist(), engine)
+                result = numpy.asarray(fft.ifft(None, spectrum, engine))
+                numpy.testing.assert_allclose(
+                    result, x, rtol=0, atol=1e-12 * length,
+                    err_msg="%s engine, N = %d" % (engine, length))
+        return
+
+
+class RealFFTTest(unittest.TestCase):
+    """rfft and irfft against the complex FFT"""
+
+    # Even lengths: powers of two, mixed radix and Bluestein half lengths
+    lengths = [2, 4, 8, 64, 1024, 6, 12, 30, 100, 14, 194]
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(4)
+        return
+
+    def test_rfft_matches_fft(self):
+        for engine in engines:
+            for length in self.lengths:
+                x = self.random.randn(length)
+                expected = numpy.fft.fft(x)[:length // 2 + 1]
+                result = numpy.asarray(fft.rfft(None, x.tolist(), engine))
+                numpy.testing.assert_allclose(
+                    result, expected, rtol=0, atol=1e-9 * length,
+                    err_msg="%s engine, N = %d" % (engine, length))
+        return
+
+    def test_rfft_matches_own_fft(self):
+        for engine in engines:
+            for length in self.lengths:
+                x = self.random.randn(length)
+                expected = numpy.asarray(fft.fft(None, x.tolist(), engine))
+                result = numpy.asarray(fft.rfft(None, x.tolist(), engine))
+                numpy.testing.assert_allclose(
+                    result, expected[:length // 2 + 1], rtol=0,
+                    atol=1e-9 * length,
+                    err_msg="%s engine, N = %d" % (engine, length))
+        return
+
+    def test_irfft_inverts_rfft(self):
+        for engine in engines:
+            for length in self.lengths:
+                x = self.random.randn(length)
+                spectrum = fft.rfft(None, x.tolist(), engine)
+                result = numpy.asarray(fft.irfft(None, spectrum, engine))
+                self.assertEqual(result.shape, (length, ))
+                numpy.testing.assert_allclose(
+                    result.real, x, rtol=0, atol=1e-12 * length,
+                    err_msg="%s engine, N = %d" % (engine, length))
+        return
+
+    def test_irfft_matches_numpy(self):
+        for engine in engines:
+            for length in self.lengths:
+                spectrum = self.random.randn(length // 2 + 1) + \
+                 1j * self.random.randn(length // 2 + 1)
+                spectrum[0] = spectrum[0].real
+                spectrum[-1] = spectrum[-1].real
+                expected = numpy.fft.irfft(spectrum, length)
+                result = numpy.asarray(
+                    fft.irfft(None, spectrum.tolist(), engine))
+                numpy.testing.assert_allclose(
+                    result.real, expected, rtol=0, atol=1e-12 * length,
+                    err_msg="%s engine, N = %d" % (engine, length))
+        return
+
+    def test_odd_length_is_rejected(self):
+        for engine in engines:
+            self.assertRaises(ValueError, fft.rfft, None, [1.0, 2.0, 3.0],
+                              engine)
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#-------------------------------------------------------------------------------
+# Tests of fixedfft.py against a scalar model of the butterfly arithmetic
+#
+# Run with: python -m unittest discover -s radix2-fft
+#-------------------------------------------------------------------------------
+
+import unittest
+
+import numpy
+
+import fft
+import fixedfft
+
+
+#
+# Scalar model of FixedFFT, one butterfly at a time with Python integers
+#
+def model_fft(real, imag, bits, scaling, rounding):
+    length = len(real)
+    wr, wi = fixedfft.fixed_twiddles(length, bits)
+    re, im = [int(v) for v in real], [int(v) for v in imag]
+    low, high = -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+    qbits = bits - 1
+    exponent = 0
+
+    def sat(v):
+        return max(low, min(high, v))
+
+    def shift(v, count):
+        if rounding == "nearest" and count:
+            v += 1 << (count - 1)
+        return v >> count
+
+    re, im = [sat(v) for v in re], [sat(v) for v in im]
+    for stage in range(fft.fft_stages(length)):
+        if scaling == "stage":
+            count = 1
+        elif scaling == "bfp":
+            peak = max([abs(v) for v in re + im])
+            count = int(peak >= 1 << (bits - 2))
+        else:
+            count = 0
+        exponent += count
+
+        groupsize = length >> (stage + 1)
+        for group in range(1 << stage):
+            for butterfly in range(groupsize):
+                i1 = group * groupsize * 2 + butterfly
+                i2 = i1 + groupsize
+                k = butterfly << stage
+                sr = sat(shift(re[i1] + re[i2], count))
+                si = sat(shift(im[i1] + im[i2], count))
+                dr = sat(shift(re[i1] - re[i2], count))
+                di = sat(shift(im[i1] - im[i2], count))
+                pr = sat(shift(dr * int(wr[k]) - di * int(wi[k]), qbits))
+                pi = sat(shift(dr * int(wi[k]) + di * int(wr[k]), qbits))
+                re[i1], im[i1], re[i2], im[i2] = sr, si, pr, pi
+
+    table = fft.fft_bitrev_table(length)
+    return [re[k] for k in table], [im[k] for k in table], exponent
+
+
+class FixedFFTTest(unittest.TestCase):
+    """FixedFFT bit-exact against the scalar model"""
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(10)
+        return
+
+    def random_words(self, bits, shape, scale=1.0):
+        limit = int(scale * (1 << (bits - 1)))
+        return self.random.randint(-limit, limit, size=shape)
+
+    def test_bit_exact(self):
+        for bits in [16, 32]:
+            for scaling in fixedfft.scaling_modes:
+                for rounding in fixedfft.rounding_modes:
+                    for length in [2, 8, 64]:
+                        # Small inputs so that "none" scaling stays in range
+                        scale = 1.0 / length if scaling == "none" else 1.0
+                        real = self.random_words(bits, length, scale)
+                        imag = self.random_words(bits, length, scale)
+
+                        ffft = fixedfft.FixedFFT(length, bits, scaling,
+                                                 rounding)
+                        re, im, exponent = ffft.execute(real, imag)
+                        expected = model_fft(real, imag, bits, scaling,
+                                             rounding)
+                        message = "Q%d %s %s N = %d" % (bits - 1, scaling,
+                                                        rounding, length)
+                        self.assertEqual(re.tolist(), expected[0], message)
+                        self.assertEqual(im.tolist(), expected[1], message)
+                        self.assertEqual(int(exponent), expected[2], message)
+        return
+
+    def test_saturation_is_modelled(self):
+        # Full scale input overflows without scaling
+        bits, length = 16, 32
+        real = numpy.full(length, (1 << (bits - 1)) - 1)
+        imag = numpy.zeros(length, dtype=numpy.int64)
+        ffft = fixedfft.FixedFFT(length, bits, "none")
+        re, im, exponent = ffft.execute(real, imag)
+        expected = model_fft(real, imag, bits, "none", "nearest")
+        self.assertEqual(re.tolist(), expected[0])
+        self.assertEqual(im.tolist(), expected[1])
+        self.assertTrue(ffft.overflows.sum() > 0)
+        return
+
+    def test_batch_matches_single(self):
+        bits, length = 16, 64
+        for scaling in fixedfft.scaling_modes:
+            block = self.random_words(bits, (5, length), 0.5 / length)
+            re, im, exponent = fixedfft.FixedFFT(length, bits,
+                                                 scaling).execute(block)
+            self.assertEqual(exponent.shape, (5, ))
+            for row in range(5):
+                single = fixedfft.FixedFFT(length, bits,
+                                           scaling).execute(block[row])
+                self.assertEqual(re[row].tolist(), single[0].tolist())
+                self.assertEqual(im[row].tolist(), single[1].tolist())
+                self.assertEqual(exponent[row], single[2])
+        return
+
+    def test_close_to_float_fft(self):
+        bits, length = 32, 256
+        samples = self.random_words(bits, length, 0.5)
+        result = fixedfft.to_complex(*fixedfft.FixedFFT(length,
+                                                        bits).execute(samples))
+        reference = numpy.fft.fft(samples)
+        error = numpy.abs(result - reference).max()
+        self.assertTrue(error < 1e-6 * numpy.abs(reference).max(), error)
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#-------------------------------------------------------------------------------
+# Tests of stft.py: istft(stft(x)) round trips
+#
+# Run with: python -m unittest discover -s radix2-fft
+#-------------------------------------------------------------------------------
+
+import os
+import wave
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import stft
+
+
+# Split samples into chunks of random lengths (including empty chunks)
+def random_chunks(random, samples):
+    chunks, pos = [], 0
+    while pos < len(samples):
+        count = random.randint(0, 700)
+        chunks.append(samples[pos:pos + count])
+        pos += count
+    return chunks
+
+
+# Rebuild signal from stft frames
+def round_trip(source, length, hop, window, engine="numpy"):
+    frames = stft.stft(source, length, hop, window, engine)
+    blocks = list(stft.istft(frames, length, hop, window, engine))
+    return numpy.concatenate(blocks)
+
+
+class RoundTripTest(unittest.TestCase):
+    """istft(stft(x)) == x"""
+
+    # (window, frame length, hop)
+    cases = [("hann", 256, 64), ("hann", 256, 128), ("hann", 512, 32),
+             ("hamming", 256, 128), ("hamming", 256, 64),
+             ("rect", 256, 256), ("rect", 256, 100), ("rect", 128, 37)]
+
+    def setUp(self):
+        self.random = numpy.random.RandomState(8)
+        self.directory = tempfile.mkdtemp()
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        return
+
+    def assert_round_trip(self, out, samples, message):
+        self.assertTrue(len(out) >= len(samples), message)
+        numpy.testing.assert_allclose(out[:len(samples)], samples, rtol=0,
+                                      atol=1e-12, err_msg=message)
+        numpy.testing.assert_allclose(out[len(samples):], 0.0, rtol=0,
+                                      atol=1e-12, err_msg=message)
+        return
+
+    def test_chunked_iterable(self):
+        samples = self.random.uniform(-1.0, 1.0, 10007)
+        for window, length, hop in self.cases:
+            chunks = random_chunks(self.random, samples)
+            out = round_trip(iter(chunks), length, hop, window)
+            self.assert_round_trip(out, samples,
+                                   "%s %d/%d" % (window, length, hop))
+        return
+
+    def test_python_engine(self):
+        samples = self.random.uniform(-1.0, 1.0, 1000)
+        out = round_trip([samples], 64, 16, "hann", "python")
+        self.assert_round_trip(out, samples, "python engine")
+        return
+
+    def test_wav_file(self):
+        # 16-bit stereo file, channel None mixes the channels
+        pcm = self.random.randint(-2**15, 2**15, (10007, 2)).astype("<i2")
+        filename = os.path.join(self.directory, "test.wav")
+        waveout = wave.open(filename, "wb")
+        waveout.setnchannels(2)
+        waveout.setsampwidth(2)
+        waveout.setframerate(16000)
+        waveout.writeframes(pcm.tobytes())
+        waveout.close()
+
+        samples = pcm.astype(numpy.float64).mean(axis=1) / 2**15
+        for window, length, hop in self.cases[:4]:
+            out = round_trip(filename, length, hop, window)
+            self.assert_round_trip(out, samples,
+                                   "%s %d/%d" % (window, length, hop))
+
+        left = pcm[:, 0] / 2.0**15
+        frames = stft.stft(filename, 256, 64, "hann", "numpy", 0)
+        out = numpy.concatenate(list(stft.istft(frames, 256, 64, "hann")))
+        self.assert_round_trip(out, left, "channel 0")
+        return
+
+    def test_hop_that_can_not_be_inverted(self):
+        # Hann is zero at the frame edges, so hop == length leaves gaps
+        frames = stft.stft([numpy.ones(1024)], 256, 256, "hann")
+        self.assertRaises(ValueError, list,
+                          stft.istft(frames, 256, 256, "hann"))
+        self.assertRaises(ValueError, list, stft.istft([], 256, 0, "hann"))
+        self.assertRaises(ValueError, list, stft.stft([], 256, 257, "hann"))
+        return
+
+
+if __name__ == "__main__":
+    unittest.main()